@@ -0,0 +1,349 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import pathlib
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from tmcp_parser import Shot
+from tmcp_patterns import ShotPatternIndex
+
+
+SERVES = '456'
+STROKES = 'fbrsvzmlopuyhijkt'
+DIRECTIONS = '123'
+DEPTHS = '789'
+POSITIONS = '+-='
+ERRORS = 'nwdx'
+
+
+def parse_scale(scale: str) -> int:
+    multipliers = {'k': 10 ** 3, 'm': 10 ** 6}
+    if scale[-1].lower() in multipliers:
+        return int(float(scale[:-1]) * multipliers[scale[-1].lower()])
+    return int(scale)
+
+
+def synthetic_point(rng: np.random.Generator) -> str:
+    # an MCP-style rally: serve, return with depth, rally shots, then a winner or an error
+    s = rng.choice(list(SERVES))
+    if rng.random() < 0.1:
+        return s + rng.choice(list(ERRORS))
+    for shot_nbr in range(rng.geometric(0.25) - 1):
+        s += rng.choice(list(STROKES))
+        if rng.random() < 0.1:
+            s += rng.choice(list(POSITIONS))
+        s += rng.choice(list(DIRECTIONS))
+        if shot_nbr == 0:
+            s += rng.choice(list(DEPTHS))
+    end = rng.random()
+    if end < 0.3:
+        return s + '*'
+    return s + rng.choice(list(ERRORS)) + ('@' if end < 0.7 else '#')
+
+
+def synthetic_points(n_shots: int, seed: int = 0) -> pd.DataFrame:
+    # a charting points frame with at least n_shots shots; point strings are drawn from a pool with a skewed
+    # distribution so common strings repeat the way they do in real MCP data
+    rng = np.random.default_rng(seed)
+    pool = pd.Series([synthetic_point(rng) for _ in range(min(max(n_shots // 5, 10), 20000))]).unique()
+    pool_shots = np.array([len(Shot.segment_string(s)) for s in pool])
+    n_points = int(n_shots / pool_shots.mean() * 0.85) + 1
+    first = (rng.zipf(1.2, n_points) - 1) % len(pool)
+    second = (rng.zipf(1.2, n_points) - 1) % len(pool)
+    has_second = rng.random(n_points) < 0.15
+    while pool_shots[first].sum() + pool_shots[second[has_second]].sum() < n_shots:
+        first = np.concatenate([first, first[:max(n_points // 10, 1)]])
+        second = np.concatenate([second, second[:max(n_points // 10, 1)]])
+        has_second = np.concatenate([has_second, has_second[:max(n_points // 10, 1)]])
+        n_points = len(first)
+    # the full charting points layout, as in the MCP files
+    match_nbr = np.arange(n_points) // 150
+    svr = np.arange(n_points) // 6 % 2 + 1
+    zeros = np.zeros(n_points, dtype=np.int64)
+    return pd.DataFrame({
+        'match_id': [f'2019{m % 10000:04d}-M-Open_{m % 4}-R32-Player_{m}-Player_{m + 1}' for m in match_nbr],
+        'Pt': np.arange(n_points) % 150 + 1,
+        'Set1': zeros, 'Set2': zeros, 'Gm1': zeros, 'Gm2': zeros, 'Pts': '0-0', 'Gm#': 1, 'TbSet': 1, 'TB': 0,
+        'TBpt': None,
+        'Svr': svr,
+        'Ret': 3 - svr,
+        'Serving': 'P1',
+        '1st': pool[first],
+        '2nd': np.where(has_second, pool[second], None),
+        'Notes': None,
+        'PtWinner': rng.integers(1, 3, n_points),
+    })
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    # registers setup(points_df) -> (run, n_items) or (run, n_items, cleanup); run() is what gets timed and
+    # cleanup() is called once the benchmark is done
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _point_strs(df):
+    return df['1st'].tolist() + df['2nd'].dropna().tolist()
+
+
+@benchmark('segment_string')
+def bench_segment_string(df):
+    strs = _point_strs(df)
+    return lambda: [Shot.segment_string(s) for s in strs], sum(len(Shot.segment_string(s)) for s in strs)
+
+
+@benchmark('parse_shot_string')
+def bench_parse_shot_string(df):
+    shot_strs = [
+        (sub_str, position == 1) for s in _point_strs(df) for position, sub_str in enumerate(Shot.segment_string(s))
+    ]
+    return lambda: [Shot.parse_shot_string(sub_str, is_return) for sub_str, is_return in shot_strs], len(shot_strs)
+
+
+@benchmark('parse_shots_string')
+def bench_parse_shots_string(df):
+    strs = _point_strs(df)
+    return lambda: [Shot.parse_shots_string(s) for s in strs], sum(len(Shot.segment_string(s)) for s in strs)
+
+
+@benchmark('parse_shots_string_nocache')
+def bench_parse_shots_string_nocache(df):
+    return bench_parse_shots_string(df)
+
+
+@benchmark('explode_df')
+def bench_explode_df(df):
+    n_shots = sum(len(Shot.segment_string(s)) for s in _point_strs(df))
+    return lambda: Shot.explode_df(df.copy()), n_shots
+
+
+@benchmark('explode_df_columnar')
+def bench_explode_df_columnar(df):
+    n_shots = sum(len(Shot.segment_string(s)) for s in _point_strs(df))
+    return lambda: Shot.explode_df(df, columnar=True), n_shots
+
+
+@benchmark('pattern_index_build')
+def bench_pattern_index_build(df):
+    n_shots = sum(len(Shot.segment_string(s)) for s in _point_strs(df))
+
+    def run():
+        index = ShotPatternIndex()
+        index.add_points(df)
+        index.find([None])
+    return run, n_shots
+
+
+@benchmark('pattern_index_query')
+def bench_pattern_index_query(df):
+    # a wide serve, any return, then a forehand winner; items are the shots searched
+    index = ShotPatternIndex()
+    index.add_points(df)
+    pattern = [{'serve_direction': 'wide'}, None, {'stroke_type': 'forehand', 'terminal': 'winner'}]
+    index.find(pattern)
+    return lambda: index.find(pattern), index.count([None])
+
+
+@benchmark('pattern_index_add')
+def bench_pattern_index_add(df):
+    # re-adding the last match of an index over df, then a query; items are the shots searched
+    index = ShotPatternIndex()
+    index.add_points(df)
+    last_match = df[df['match_id'] == df['match_id'].iloc[-1]]
+    pattern = [{'stroke_type': 'forehand', 'terminal': 'winner'}]
+
+    def run():
+        index.add_points(last_match)
+        index.find(pattern)
+    return run, index.count([None])
+
+
+@benchmark('import_parser')
+def bench_import_parser(df):
+    # cold start of a service that only parses point strings: a fresh interpreter importing tmcp_parser and
+    # parsing one point, which must not pull in pandas
+    code = (
+        'import sys, tmcp_parser; tmcp_parser.Shot.parse_shots_string(sys.argv[1]); '
+        'sys.exit("pandas" in sys.modules or "numpy" in sys.modules)'
+    )
+    point_str = df['1st'].iloc[0]
+    cwd = pathlib.Path(__file__).resolve().parent
+    return lambda: subprocess.run([sys.executable, '-c', code, point_str], cwd=cwd, check=True), 1
+
+
+@benchmark('dbloader_insert')
+def bench_dbloader_insert(df):
+    # every DBLoader insert step against the in-process SQLite stand-in the tests use
+    from tmcp_sqlite import SQLiteDBLoader
+
+    tmp = tempfile.TemporaryDirectory()
+    tmp_dir = pathlib.Path(tmp.name)
+    matches = df.drop_duplicates('match_id')
+    pd.DataFrame({
+        'match_id': matches['match_id'],
+        'Player 1': matches['match_id'].str.split('-').str[-2],
+        'Player 2': matches['match_id'].str.split('-').str[-1],
+        'Pl 1 hand': 'R', 'Pl 2 hand': 'R', 'Gender': 'M', 'Date': 20190101, 'Tournament': 'Open',
+        'Round': 'R32', 'Time': None, 'Court': None, 'Surface': 'Hard', 'Umpire': None, 'Best of': 3,
+        'Final TB?': 1, 'Charted by': 'benchmark',
+    }).to_csv(tmp_dir / 'charting-m-matches.csv', index=False)
+    df.to_csv(tmp_dir / 'charting-m-points.csv', index=False)
+    n_shots = sum(len(Shot.segment_string(s)) for s in _point_strs(df))
+
+    def run():
+        db_path = tmp_dir / 'tennis.db'
+        db_path.unlink(missing_ok=True)
+        with SQLiteDBLoader(tmp_dir, 'root', '', str(db_path), 'localhost') as db:
+            db.insert_tournaments()
+            db.insert_players()
+            db.insert_matches()
+            db.insert_shots()
+    return run, n_shots + len(matches), tmp.cleanup
+
+
+def _reset_cache(name: str) -> None:
+    # every run starts from a cold parse cache so repeats measure the same work
+    if name.endswith('_nocache'):
+        Shot.configure_cache(maxsize=0)
+    else:
+        Shot.configure_cache()
+
+
+def run_benchmark(name: str, n_shots: int, repeat: int, trace_allocations: bool) -> dict:
+    df = synthetic_points(n_shots)
+    run, n_items, *cleanup = BENCHMARKS[name](df)
+    try:
+        seconds = []
+        # stdout is reserved for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            for _ in range(repeat):
+                _reset_cache(name)
+                start = time.perf_counter()
+                run()
+                seconds.append(time.perf_counter() - start)
+        result = {
+            'name': name,
+            'n_shots': n_shots,
+            'n_items': n_items,
+            'seconds': min(seconds),
+            'items_per_sec': n_items / min(seconds),
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        if trace_allocations:
+            # a separate traced run: tracemalloc slows everything down, so it never shares a run with the timing
+            _reset_cache(name)
+            blocks = sys.getallocatedblocks()
+            tracemalloc.start()
+            with contextlib.redirect_stdout(sys.stderr):
+                run()
+            result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+            result['allocated_blocks'] = sys.getallocatedblocks() - blocks
+    finally:
+        for close in cleanup:
+            close()
+    return result
+
+
+def _run_in_child(args):
+    return run_benchmark(*args)
+
+
+def regressions(results, baseline, threshold):
+    # a benchmark regresses when its throughput drops or its peak RSS grows by more than threshold
+    failures = []
+    previous = {(r['name'], r['n_shots']): r for r in baseline['results']}
+    for result in results:
+        before = previous.get((result['name'], result['n_shots']))
+        if before is None:
+            continue
+        if result['items_per_sec'] < before['items_per_sec'] * (1 - threshold):
+            failures.append(f"{result['name']}@{result['n_shots']}: {result['items_per_sec']:.0f} items/s "
+                            f"vs {before['items_per_sec']:.0f} before")
+        if result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + threshold):
+            failures.append(f"{result['name']}@{result['n_shots']}: {result['peak_rss_mb']:.0f} MB peak RSS "
+                            f"vs {before['peak_rss_mb']:.0f} MB before")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--scales',
+        default='10k',
+        type=str,
+        help='comma separated shot counts, e.g. 10k,1m,10m'
+    )
+    parser.add_argument(
+        '--benchmarks',
+        default=','.join(BENCHMARKS),
+        type=str
+    )
+    parser.add_argument(
+        '--output',
+        type=str
+    )
+    parser.add_argument(
+        '--baseline',
+        type=str
+    )
+    parser.add_argument(
+        '--threshold',
+        default=0.2,
+        type=float
+    )
+    parser.add_argument(
+        '--repeat',
+        default=3,
+        type=int,
+        help='runs per benchmark, the fastest one is reported'
+    )
+    parser.add_argument(
+        '--allocations',
+        action='store_true'
+    )
+    args = parser.parse_args()
+
+    # every benchmark runs in a fresh process so peak RSS and the parse cache start from scratch
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for scale in args.scales.split(','):
+        for name in args.benchmarks.split(','):
+            with context.Pool(1) as pool:
+                result = pool.apply(_run_in_child, ((name, parse_scale(scale), args.repeat, args.allocations), ))
+            print(f"{name:<28} {result['n_shots']:>10} shots {result['seconds']:>9.3f}s "
+                  f"{result['items_per_sec']:>12.0f} items/s {result['peak_rss_mb']:>8.1f} MB", file=sys.stderr)
+            results.append(result)
+
+    report = {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        pathlib.Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        failures = regressions(results, json.loads(pathlib.Path(args.baseline).read_text()), args.threshold)
+        for failure in failures:
+            print(f'regression: {failure}', file=sys.stderr)
+        sys.exit(1 if failures else 0)
@@ -1,189 +1,553 @@
-import argparse
+import datetime
+import functools
+import hashlib
+import io
+import itertools
+import json
+import math
 import pathlib
+import queue
+import tempfile
+import threading
+import time
 
 import numpy as np
 import mysql.connector
+import mysql.connector.pooling
 import pandas as pd
 
+import tmcp_metrics
+from tmcp_parser import Shot
+from tmcp_schema import charting_files, matches_csv_kwargs, points_csv_kwargs, tour_tag
+
+
+# natural key of each table DBLoader maps to ids, and how names are compared when looking them up
+DIMENSION_KEYS = {
+    'tournament_d': 'name',
+    'player_d': 'name',
+    'match_f': 'mcp_id',
+}
+
+
+def normalize_key(table, key):
+    if table in ('tournament_d', 'player_d'):
+        return key.lower().strip()
+    return key
+
+
+def normalize_keys(table, keys: pd.Series) -> pd.Series:
+    # normalize_key over a whole column of strings
+    if table in ('tournament_d', 'player_d'):
+        return keys.str.lower().str.strip()
+    return keys
+
+
+def tsv_value(v):
+    # one field in LOAD DATA's default format: backslash escaped, \N for NULL, booleans as 1/0 (LOAD DATA loads
+    # the text True/False into an integer column as 0, with only a warning) and dates as ISO text
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return '\\N'
+    if isinstance(v, (bool, np.bool_)):
+        return '1' if v else '0'
+    if isinstance(v, datetime.datetime):
+        return v.isoformat(sep=' ')
+    if isinstance(v, datetime.date):
+        return v.isoformat()
+    return str(v).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class LoadCheckpoints(object):
+    # per source file: how many bytes and rows are loaded, the sha1 of those bytes and the last match loaded. They
+    # live in the load_checkpoint table of the database being loaded, so every database loaded from the same files
+    # keeps its own and a new or reset database starts from the beginning.
+
+    def __init__(self, conn):
+        with conn.cursor(dictionary=True) as cursor:
+            cursor.execute(
+                """
+                    CREATE TABLE IF NOT EXISTS load_checkpoint (
+                        source_file VARCHAR(255) PRIMARY KEY,
+                        byte_offset BIGINT NOT NULL,
+                        sha1 CHAR(40) NOT NULL,
+                        row_count BIGINT NOT NULL,
+                        details TEXT
+                    )
+                """
+            )
+            cursor.execute('SELECT source_file, byte_offset, sha1, row_count, details FROM load_checkpoint')
+            self.checkpoints = {
+                row['source_file']: dict(
+                    offset=row['byte_offset'], sha1=row['sha1'], rows=row['row_count'], **json.loads(row['details'] or '{}')
+                )
+                for row in cursor.fetchall()
+            }
+        conn.commit()
+
+    def resume(self, source_path):
+        # the loaded prefix is only trusted while the file has been appended to, not rewritten
+        checkpoint = self.checkpoints.get(pathlib.Path(source_path).name)
+        if checkpoint is None or pathlib.Path(source_path).stat().st_size < checkpoint['offset']:
+            return 0, hashlib.sha1(), 0
+        sha1 = hashlib.sha1()
+        with open(source_path, 'rb') as f:
+            remaining = checkpoint['offset']
+            while remaining > 0:
+                block = f.read(min(remaining, 1 << 20))
+                sha1.update(block)
+                remaining -= len(block)
+        if sha1.hexdigest() != checkpoint['sha1']:
+            return 0, hashlib.sha1(), 0
+        return checkpoint['offset'], sha1, checkpoint['rows']
+
+    def update(self, source_path, offset, sha1, rows, conn, **details):
+        # called on conn right after the rows up to offset committed; a crash in between only makes the next run
+        # read those rows again, and the loaders skip rows already in the database
+        name = pathlib.Path(source_path).name
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                    REPLACE INTO load_checkpoint
+                        (source_file, byte_offset, sha1, row_count, details)
+                    VALUES (%s, %s, %s, %s, %s)
+                """,
+                (name, offset, sha1, rows, json.dumps(details, default=str))
+            )
+        conn.commit()
+        self.checkpoints[name] = dict(offset=offset, sha1=sha1, rows=rows, **details)
+
+
+def iter_csv_records(f):
+    # the raw CSV records of a binary file, each ending at a newline outside quotes, so a quoted field may
+    # span lines; a record not ended by a newline at the end of the file (one being appended) is not yielded
+    record = []
+    in_quotes = False
+    for line in f:
+        record.append(line)
+        # a doubled quote inside a quoted field toggles twice, so counting quotes is enough
+        in_quotes ^= line.count(b'"') % 2 == 1
+        if not in_quotes and line.endswith(b'\n'):
+            yield b''.join(record)
+            record = []
+
+
+def iter_csv_rows(path, offset=0, sha1=None, chunksize=None, **read_csv_kwargs):
+    # yields (rows, end offset) for the whole records after a byte offset, chunksize records at a time;
+    # sha1 is updated with every byte consumed so it always covers the file up to the yielded offset
+    sha1 = hashlib.sha1() if sha1 is None else sha1
+    with open(path, 'rb') as f:
+        header = next(iter_csv_records(f), b'')
+        if offset == 0:
+            sha1.update(header)
+            offset = len(header)
+        f.seek(offset)
+        records = iter_csv_records(f)
+        while True:
+            block = b''.join(itertools.islice(records, chunksize))
+            if not block:
+                break
+            sha1.update(block)
+            offset += len(block)
+            yield pd.read_csv(io.BytesIO(header + block), **read_csv_kwargs), offset
+
+
+class ConcurrentWriter(object):
+    # producer/consumer stage for DBLoader: the caller keeps parsing while `writers` threads insert the
+    # submitted rows, each on its own connection. The bounded queue blocks the caller once max_pending jobs
+    # are waiting, and on_commit callbacks run in submission order, only after every earlier job committed.
+
+    def __init__(self, loader, writers, max_pending=None):
+        self.loader = loader
+        self.jobs = queue.Queue(maxsize=max_pending or 2 * writers)
+        self.lock = threading.Lock()
+        self.error = None
+        self._submitted = 0
+        self._next_callback = 0
+        self._committed = {}
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(writers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, table, columns, rows, ignore=False, on_commit=None):
+        if self.error is not None:
+            raise self.error
+        self.jobs.put((self._submitted, table, columns, rows, ignore, on_commit))
+        self._submitted += 1
+
+    def _run(self):
+        conn = self.loader._connect()
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+                seq, table, columns, rows, ignore, on_commit = job
+                if self.error is not None:
+                    continue
+                try:
+                    self.loader._insert_rows(table, columns, rows, ignore=ignore, conn=conn)
+                    self._mark_committed(seq, on_commit, conn)
+                except Exception as e:
+                    self.error = e
+        finally:
+            conn.close()
+
+    def _mark_committed(self, seq, on_commit, conn):
+        # callbacks get the connection of the writer thread that runs them
+        with self.lock:
+            self._committed[seq] = on_commit
+            while self._next_callback in self._committed:
+                callback = self._committed.pop(self._next_callback)
+                if callback is not None:
+                    callback(conn=conn)
+                self._next_callback += 1
+
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
 
 class DBLoader(object):
 
-    def __init__(self, datapath, user, password, database, host):
+    def __init__(self, datapath, user, password, database, host, batch_size=10000, load_data_infile=False,
+                 incremental=False, writers=1):
         self.datapath = pathlib.Path(datapath)
         self.user = user
         self.password = password
         self.database_name = database
         self.database_host = host
+        self.batch_size = batch_size
+        self.load_data_infile = load_data_infile
+        self.incremental = incremental
+        self.writers = writers
+        self._pool = None
+        self.checkpoints = None
+        self._matches = {}
+        self._matches_checkpoints = {}
+        self._dimension_ids = {}
+        self.anomalies = []
 
     def __enter__(self):
-        print(self.user, self.password, self.database_host, self.database_name)
-        self.conn = mysql.connector.connect(
+        self.conn = self._connect()
+        if self.incremental:
+            self.checkpoints = LoadCheckpoints(self.conn)
+        return self
+
+    def _connect(self):
+        # with concurrent writers every connection comes from one pool: the loader's own plus one per writer
+        if self.writers > 1:
+            if self._pool is None:
+                self._pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_size=self.writers + 1,
+                    user=self.user,
+                    password=self.password,
+                    host=self.database_host,
+                    database=self.database_name,
+                    allow_local_infile=self.load_data_infile
+                )
+            return self._pool.get_connection()
+        return mysql.connector.connect(
             user=self.user,
             password=self.password,
             host=self.database_host,
-            database=self.database_name
+            database=self.database_name,
+            allow_local_infile=self.load_data_infile
         )
-        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.conn.close()
 
-    def insert_tournaments(self, male=True):
-        match_path = self.datapath / f'charting-{"m" if male else "f"}-matches.csv'
-        df = pd.read_csv(match_path)
+    def _insert_rows(self, table, columns, rows, ignore=False, conn=None):
+        # executemany is rewritten into multi-row INSERTs by mysql.connector; one transaction per batch
+        conn = self.conn if conn is None else conn
+        if self.load_data_infile:
+            return self._load_rows(table, columns, rows, ignore=ignore, conn=conn)
+        sql = f"""
+            INSERT {'IGNORE ' if ignore else ''}INTO {table}
+                ({', '.join(columns)})
+            VALUES ({', '.join(['%s'] * len(columns))})
+        """
+        with tmcp_metrics.timer('db.write'), conn.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start: start + self.batch_size])
+                conn.commit()
+                tmcp_metrics.count('batches_committed')
+        tmcp_metrics.count('rows_written', len(rows))
 
-        with self.conn.cursor(dictionary=True) as cursor:
-            cursor.execute(
-                """
-                    SELECT DISTINCT 
-                        name
-                    FROM tournament_d
-                """
-            )
-            tournament_names = cursor.fetchall()
+    def _load_rows(self, table, columns, rows, ignore=False, conn=None):
+        conn = self.conn if conn is None else conn
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.tsv') as f:
+            for row in rows:
+                f.write('\t'.join(tsv_value(v) for v in row) + '\n')
+            f.flush()
+            with tmcp_metrics.timer('db.write'):
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"""
+                            LOAD DATA LOCAL INFILE %s
+                            {'IGNORE ' if ignore else ''}INTO TABLE {table}
+                            CHARACTER SET utf8mb4
+                            ({', '.join(columns)})
+                        """,
+                        (f.name, )
+                    )
+                conn.commit()
+        tmcp_metrics.count('batches_committed')
+        tmcp_metrics.count('rows_written', len(rows))
 
-        existing_tournaments = set([row['name'] for row in tournament_names])
-        new_tournaments = set(df['Tournament'].unique().tolist()) - existing_tournaments
+    def matches_df(self, male=True):
+        # the matches file is read once per tour and shared by every insert step; in incremental mode only
+        # the rows appended since the last checkpoint are read
+        if male not in self._matches:
+            match_path = self.datapath / f'charting-{tour_tag(male)}-matches.csv'
+            if self.incremental:
+                offset, sha1, n_rows = self.checkpoints.resume(match_path)
+                chunks = []
+                chunk_iter = iter_csv_rows(match_path, offset, sha1, **matches_csv_kwargs())
+                for chunk, offset in tmcp_metrics.timed_iter(chunk_iter, 'read_csv'):
+                    chunks.append(chunk)
+                df = pd.concat(chunks, ignore_index=True) if chunks else pd.read_csv(
+                    match_path, nrows=0, **matches_csv_kwargs()
+                )
+                if len(df) > 0:
+                    self._matches_checkpoints[male] = dict(
+                        offset=offset,
+                        sha1=sha1.hexdigest(),
+                        rows=n_rows + len(df),
+                        last_match_id=df['match_id'].iloc[-1],
+                        last_date=df['Date'].iloc[-1]
+                    )
+            else:
+                with tmcp_metrics.timer('read_csv'):
+                    df = pd.read_csv(match_path, **matches_csv_kwargs())
+            tmcp_metrics.count('rows_read', len(df))
+            self._matches[male] = df
+        return self._matches[male]
 
-        with self.conn.cursor(dictionary=True) as cursor:
-            for tournament_name in new_tournaments:
+    def dimension_ids(self, table, keys):
+        # natural key -> id, cached for the life of the loader; only keys not seen before are looked up
+        key_column = DIMENSION_KEYS[table]
+        ids = self._dimension_ids.setdefault(table, {})
+        missing = list({key for key in keys if isinstance(key, str) and normalize_key(table, key) not in ids})
+        with tmcp_metrics.timer('db.lookup'), self.conn.cursor(dictionary=True) as cursor:
+            for start in range(0, len(missing), self.batch_size):
+                batch = missing[start: start + self.batch_size]
                 cursor.execute(
-                    """
-                        INSERT INTO tournament_d
-                            (name) 
-                        VALUES (%s)
+                    f"""
+                        SELECT id, {key_column}
+                        FROM {table}
+                        WHERE {key_column} IN ({', '.join(['%s'] * len(batch))})
                     """,
-                    (tournament_name, )
+                    tuple(batch)
                 )
-            self.conn.commit()
+                ids.update({normalize_key(table, row[key_column]): row['id'] for row in cursor.fetchall()})
+        return ids
 
-    def insert_players(self, male=True):
-        match_path = self.datapath / f'charting-{"m" if male else "f"}-matches.csv'
-        df = pd.read_csv(match_path)
-        with self.conn.cursor(dictionary=True) as cursor:
-            cursor.execute(
-                """
-                    SELECT DISTINCT 
-                        name
-                    FROM player_d
-                """
-            )
-            player_names = cursor.fetchall()
-        existing_players = set([row['name'] for row in player_names])
-        new_players = set(df['Player 1'].str.strip().unique().tolist()) | set(df['Player 2'].str.strip().unique().tolist())
-        new_players = new_players - existing_players
-
-        with self.conn.cursor(dictionary=True) as cursor:
-            for player_name in new_players:
-                if isinstance(player_name, float):
-                    if np.isnan(player_name):
-                        continue
-                try:
-                    cursor.execute(
-                        """
-                            INSERT INTO player_d
-                                (name, male) 
-                            VALUES (%s, %s)
+    def sync_dimension(self, table, names, **columns):
+        # set-based upsert of names into a dimension table: names are stripped and normalized once, the new ones
+        # are staged in a temporary copy of the table, one INSERT ... SELECT ... WHERE NOT EXISTS adds those the
+        # table lacks and one join reads back their ids. Returns the dimension_ids map (normalized name -> id).
+        key_column = DIMENSION_KEYS[table]
+        ids = self._dimension_ids.setdefault(table, {})
+        names = pd.Series(names, dtype=object).dropna()
+        names = names[names.map(type) == str].str.strip()
+        keys = normalize_keys(table, names)
+        new = ~keys.duplicated() & ~keys.isin(list(ids))
+        if not new.any():
+            return ids
+
+        stage_columns = [key_column] + list(columns)
+        rows = [(name, *columns.values()) for name in names[new]]
+        stage = f'{table}_stage'
+        with tmcp_metrics.timer('db.sync_dimension'), self.conn.cursor(dictionary=True) as cursor:
+            cursor.execute(f'CREATE TEMPORARY TABLE {stage} LIKE {table}')
+            try:
+                for start in range(0, len(rows), self.batch_size):
+                    cursor.executemany(
+                        f"""
+                            INSERT IGNORE INTO {stage}
+                                ({', '.join(stage_columns)})
+                            VALUES ({', '.join(['%s'] * len(stage_columns))})
                         """,
-                        (player_name, 1 if male else 0)
+                        rows[start: start + self.batch_size]
                     )
-                    self.conn.commit()
-                except mysql.connector.errors.IntegrityError:
-                    pass
+                cursor.execute(
+                    f"""
+                        INSERT INTO {table}
+                            ({', '.join(stage_columns)})
+                        SELECT {', '.join(f's.{column}' for column in stage_columns)}
+                        FROM {stage} s
+                        WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{key_column} = s.{key_column})
+                    """
+                )
+                cursor.execute(
+                    f"""
+                        SELECT t.id, t.{key_column}
+                        FROM {table} t
+                        JOIN {stage} s ON t.{key_column} = s.{key_column}
+                    """
+                )
+                ids.update({normalize_key(table, row[key_column]): row['id'] for row in cursor.fetchall()})
+            finally:
+                cursor.execute(f'DROP TEMPORARY TABLE {stage}')
+        self.conn.commit()
+        tmcp_metrics.count('rows_written', len(rows))
+        return ids
+
+    @tmcp_metrics.timed('insert_tournaments')
+    def insert_tournaments(self, male=True):
+        self.sync_dimension('tournament_d', self.matches_df(male)['Tournament'])
+
+    @tmcp_metrics.timed('insert_players')
+    def insert_players(self, male=True):
+        df = self.matches_df(male)
+        self.sync_dimension('player_d', pd.concat([df['Player 1'], df['Player 2']]), male=1 if male else 0)
 
+    @tmcp_metrics.timed('insert_matches')
     def insert_matches(self, male=True):
-        match_path = self.datapath / f'charting-{"m" if male else "f"}-matches.csv'
-        df = pd.read_csv(match_path).drop_duplicates('match_id').rename(
-            columns={'Player 1': 'player1', 'Player 2': 'player2'}
+        df = self.matches_df(male).drop_duplicates('match_id').rename(
+            columns={'Player 1': 'player1', 'Player 2': 'player2', 'Best of': 'best_of'}
         )
         df['match_date'] = pd.to_datetime(df['Date'], errors='coerce', format='%Y%m%d').dt.date
         df = df[df['match_date'].notnull()]
-        with self.conn.cursor(dictionary=True) as cursor:
-            cursor.execute(
-                """
-                    SELECT DISTINCT 
-                        mcp_id
-                    FROM match_f
-                """
-            )
-            existing_mcp_ids = set([row['mcp_id'] for row in cursor.fetchall()])
-            cursor.execute(
-                """
-                    SELECT id, name
-                    FROM tournament_d
-                """
-            )
-            tournament_mapper = pd.DataFrame(cursor.fetchall()).set_index('name').to_dict()['id']
-            cursor.execute(
-                """
-                    SELECT id, name
-                    FROM player_d
-                """
-            )
-            player_mapper = pd.DataFrame(cursor.fetchall()).set_index('name').to_dict()['id']
 
+        match_ids = self.dimension_ids('match_f', df['match_id'].tolist())
+        new_df = df[~df['match_id'].isin(list(match_ids))]
 
-        player_mapper = {p.lower(): _id for (p, _id) in player_mapper.items()}
-        tournament_mapper = {t.lower(): _id for (t, _id) in tournament_mapper.items()}
+        player_names = [name.strip() for name in pd.concat([new_df['player1'], new_df['player2']]).dropna().unique()]
+        tournament_mapper = self.dimension_ids('tournament_d', new_df['Tournament'].unique().tolist())
+        player_mapper = self.dimension_ids('player_d', player_names)
 
-        new_mcp_ids = set(df['match_id'].tolist()) - existing_mcp_ids
-        new_df = df[df['match_id'].isin(new_mcp_ids)]
+        rows = []
+        for row in new_df.itertuples():
+            rows.append((
+                player_mapper[normalize_key('player_d', row.player1)] if isinstance(row.player1, str) else None,
+                player_mapper[normalize_key('player_d', row.player2)] if isinstance(row.player2, str) else None,
+                tournament_mapper[normalize_key('tournament_d', row.Tournament)],
+                row.Round,
+                row.Surface if isinstance(row.Surface, str) else None,
+                None if pd.isna(row.best_of) else int(row.best_of),
+                row.match_id,
+                row.match_date
+            ))
+        self._insert_rows(
+            'match_f',
+            ['player1_id', 'player2_id', 'tournament_id', 'round', 'surface', 'best_of_sets', 'mcp_id', 'match_date'],
+            rows
+        )
+        self.dimension_ids('match_f', new_df['match_id'].tolist())
 
-        with self.conn.cursor(dictionary=True) as cursor:
-            for row in new_df.itertuples():
-                print(row)
-                cursor.execute(
-                    """
-                        INSERT INTO match_f
-                            (player1_id, player2_id, tournament_id, round, surface, best_of_sets, mcp_id, match_date)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (
-                        player_mapper[row.player1.lower().strip()] if isinstance(row.player1, str) else None,
-                        player_mapper[row.player2.lower().strip()] if isinstance(row.player2, str) else None,
-                        tournament_mapper[row.Tournament.lower()],
-                        row.Round,
-                        row.Surface if isinstance(row.Surface, str) else None,
-                        row._14,
-                        row.match_id,
-                        row.match_date
+        if male in self._matches_checkpoints:
+            match_path = self.datapath / f'charting-{tour_tag(male)}-matches.csv'
+            self.checkpoints.update(match_path, conn=self.conn, **self._matches_checkpoints.pop(male))
+
+    @tmcp_metrics.timed('insert_shots')
+    def insert_shots(self, male=True, chunksize=100000, validate=None):
+        # shot_f, created here when missing, is keyed on (match_id, pt_nbr, first_pt, shot_sequence_nbr) and rows
+        # go in with INSERT IGNORE.
+        # A full run sends every point again and the key drops the shots already loaded (with concurrent writers
+        # chunks commit out of order, so no per-match high-water mark is safe); an incremental run resumes each
+        # points file from the checkpoint written after its last committed chunk.
+        # validate='strict' stops at the first malformed point, validate='quarantine' leaves malformed points out
+        # and collects their Shot.validate_points rows in self.anomalies. Returns rows read, shots written and
+        # seconds per points file; with concurrent writers the last chunks may still be committing at close.
+        shot_columns = [
+            'match_id', 'pt_nbr', 'first_pt', 'shot_sequence_nbr', 'court_position', 'terminal', 'error_type',
+            'serve_direction', 'stroke_type', 'return_depth', 'is_return', 'raw_string'
+        ]
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                """
+                    CREATE TABLE IF NOT EXISTS shot_f (
+                        match_id INT NOT NULL,
+                        pt_nbr INT NOT NULL,
+                        first_pt TINYINT(1) NOT NULL,
+                        shot_sequence_nbr SMALLINT NOT NULL,
+                        court_position VARCHAR(32),
+                        terminal VARCHAR(32),
+                        error_type VARCHAR(32),
+                        serve_direction VARCHAR(32),
+                        stroke_type VARCHAR(32),
+                        return_depth VARCHAR(32),
+                        is_return TINYINT(1) NOT NULL,
+                        raw_string VARCHAR(255),
+                        PRIMARY KEY (match_id, pt_nbr, first_pt, shot_sequence_nbr)
                     )
-                )
-            self.conn.commit()
+                """
+            )
+        self.conn.commit()
+        file_stats = {}
+        writer = ConcurrentWriter(self, self.writers) if self.writers > 1 else None
+        try:
+            for points_path in charting_files(self.datapath).get(tour_tag(male), {}).get('points', []):
+                stats = file_stats[points_path.name] = dict(rows=0, shots=0, seconds=0.0)
+                start = time.perf_counter()
+                if self.incremental:
+                    offset, sha1, n_rows = self.checkpoints.resume(points_path)
+                    chunks = iter_csv_rows(points_path, offset, sha1, chunksize, **points_csv_kwargs(encoding='latin1'))
+                else:
+                    # a full run needs no byte offsets, so pandas reads the chunks itself
+                    n_rows = 0
+                    chunks = (
+                        (chunk, None)
+                        for chunk in pd.read_csv(points_path, chunksize=chunksize, **points_csv_kwargs(encoding='latin1'))
+                    )
+                for points, offset in tmcp_metrics.timed_iter(chunks, 'read_csv'):
+                    tmcp_metrics.count('rows_read', len(points))
+                    if len(points) == 0:
+                        continue
+                    valid_points = points
+                    if validate == 'strict':
+                        Shot.validate_points(points, strict=True)
+                    elif validate == 'quarantine':
+                        valid_points, anomalies = Shot.quarantine_points(points)
+                        if len(anomalies) > 0:
+                            self.anomalies.append(anomalies)
+                            tmcp_metrics.count('points_quarantined', len(points) - len(valid_points))
+                    match_mapper = self.dimension_ids('match_f', valid_points['match_id'].unique().tolist())
+                    shots = Shot.explode_df(valid_points, columnar=True)
+                    with tmcp_metrics.timer('insert_shots.rows'):
+                        shots['match_id'] = shots['match_id'].map(match_mapper)
+                        shots = shots[shots['match_id'].notnull()]
+                        shots = shots[shot_columns].astype(object)
+                        shots['match_id'] = shots['match_id'].astype(int)
+                        rows = list(shots.where(shots.notnull(), None).itertuples(index=False, name=None))
 
-    def insert_shots(self):
-        pass
+                    n_rows += len(points)
+                    stats['rows'] += len(points)
+                    stats['shots'] += len(rows)
+                    on_commit = None
+                    if self.incremental:
+                        on_commit = functools.partial(
+                            self.checkpoints.update, points_path, offset, sha1.hexdigest(), n_rows,
+                            last_match_id=points['match_id'].iloc[-1]
+                        )
+                    if writer is None:
+                        self._insert_rows('shot_f', shot_columns, rows, ignore=True)
+                        if on_commit is not None:
+                            on_commit(conn=self.conn)
+                    else:
+                        writer.submit('shot_f', shot_columns, rows, ignore=True, on_commit=on_commit)
+                stats['seconds'] = time.perf_counter() - start
+        finally:
+            if writer is not None:
+                writer.close()
+        return file_stats
 
+    def load(self, male=True, chunksize=100000, validate=None):
+        # every insert step for one tour, in dependency order; returns insert_shots' per-file stats
+        self.insert_tournaments(male)
+        self.insert_players(male)
+        self.insert_matches(male)
+        return self.insert_shots(male, chunksize=chunksize, validate=validate)
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        '--data_path',
-        type=str
-    )
-    parser.add_argument(
-        '--u',
-        default='root',
-        type=str
-    )
-    parser.add_argument(
-        '--p',
-        type=str,
-        required=True
-    )
-    parser.add_argument(
-        '--host',
-        type=str,
-        required=True
-    )
-    parser.add_argument(
-        '--database',
-        type=str,
-        required=True
-    )
-    args = parser.parse_args()
-    with DBLoader(args.data_path, args.u, args.p, args.database, args.host) as db:
-        db.insert_tournaments()
-        db.insert_players()
-        db.insert_matches()
-        db.insert_shots()
+    # the loader's command line is tmcp_cli's load command
+    import sys
+
+    from tmcp_cli import main
+
+    sys.exit(main(['load'] + sys.argv[1:]))
@@ -1,8 +1,25 @@
+import contextlib
+import importlib.util
+import io
+import itertools
+import pathlib
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
 
 import pandas as pd
 
-from tmcp_parser import Shot, GroundStroke, Serve, ServeDirection, StrokeType, Terminal, ErrorType, ShotDirection, Return, ReturnDepth, CourtPosition
+import tmcp_metrics
+from tmcp_cli import main as cli_main
+from tmcp_export import export_points_csv, read_match, read_shots
+from tmcp_points import annotate_shots, point_states
+from tmcp_schema import MATCHES_DTYPES, points_csv_kwargs
+from tmcp_sqlite import SQLiteDBLoader
+from tmcp_stats import MatchStatsIndex
+from tmcp_patterns import ShotPatternIndex
+from tmcp_parser import Match, Point, Shot, GroundStroke, Serve, ServeDirection, StrokeType, Terminal, ErrorType, ShotDirection, Return, ReturnDepth, CourtPosition
 
 
 class ParserTests(unittest.TestCase):
@@ -13,6 +30,278 @@ class ParserTests(unittest.TestCase):
         self.assertTrue((explode_df['first_pt'] == False).any())
         self.assertFalse((explode_df['first_pt'] == False).all())
 
+    def test_explode_columnar(self):
+        df = pd.read_csv('test_data/points.csv', encoding='latin1').sample(200)
+        explode_df = Shot.explode_df(df.copy())
+        columnar_df = Shot.explode_df(df, columnar=True)
+        self.assertListEqual(list(explode_df.columns), list(columnar_df.columns))
+        for column in explode_df.columns:
+            self.assertListEqual(
+                explode_df[column].astype(object).where(explode_df[column].notnull(), None).tolist(),
+                columnar_df[column].astype(object).where(columnar_df[column].notnull(), None).tolist()
+            )
+
+    def test_explode_parallel(self):
+        df = pd.read_csv('test_data/points.csv', encoding='latin1')
+        # the chunk holding match b has no shot with an error type
+        no_errors = pd.DataFrame({'match_id': ['a', 'b', 'a'], 'Pt': [1, 1, 2], '1st': ['6n', '4*', '5f1*'], '2nd': ['4d', None, None]})
+        for points in (df, no_errors):
+            for columnar in (False, True):
+                pd.testing.assert_frame_equal(
+                    Shot.explode_df(points.copy(), columnar=columnar),
+                    Shot.explode_df(points.copy(), columnar=columnar, workers=2)
+                )
+        shots = Shot.explode_df(no_errors.copy())
+        self.assertEqual(shots['error_type'].dtype, object)
+        self.assertTrue(shots.loc[shots['match_id'] == 'b', 'error_type'].isnull().all())
+        self.assertEqual(shots['stroke_type'].isnull().sum(), 4)
+
+    def test_iter_explode_csv(self):
+        df = pd.read_csv('test_data/points.csv', **points_csv_kwargs(encoding='latin1'))
+        for columnar in (False, True):
+            chunks = list(Shot.iter_explode_csv('test_data/points.csv', chunksize=37, columnar=columnar, encoding='latin1'))
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual(sum(chunk['match_id'].nunique() for chunk in chunks), df['match_id'].nunique())
+            pd.testing.assert_frame_equal(
+                Shot.explode_df(df.copy(), columnar=columnar),
+                pd.concat(chunks, ignore_index=True)
+            )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            header_only = pathlib.Path(tmp_dir) / 'charting-m-points.csv'
+            df.iloc[:0].to_csv(header_only, index=False)
+            self.assertListEqual(list(Shot.iter_explode_csv(header_only, chunksize=37, columnar=True)), [])
+            self.assertEqual(cli_main(['explode', '--data_path', tmp_dir, '--out_path', tmp_dir]), 0)
+
+    def test_parse_cache(self):
+        Shot.configure_cache(maxsize=16)
+        shots = Shot.parse_shots_string('4f1*')
+        shots.pop()
+        self.assertEqual(len(Shot.parse_shots_string('4f1*')), 2)
+        info = Shot.cache_info()['parse_shots_string']
+        self.assertEqual((info.hits, info.misses, info.maxsize), (1, 1, 16))
+
+        Shot.configure_cache(maxsize=0)
+        Shot.parse_shots_string('4f1*')
+        self.assertEqual(Shot.cache_info()['parse_shots_string'].hits, 0)
+        Shot.configure_cache()
+
+    def test_validate_points(self):
+        df = pd.DataFrame({
+            'match_id': ['m1', 'm1', 'm2'],
+            'Pt': [1, 2, 1],
+            '1st': ['4f1*', '5c', ''],
+            '2nd': [None, '4f12@', '6n'],
+        })
+        errors = Shot.validate_points(df)
+        self.assertEqual(
+            errors[['match_id', 'pt_nbr', 'first_pt', 'shot_sequence_nbr', 'position']].values.tolist(),
+            [['m1', 2, True, 0, 1], ['m1', 2, False, 1, 3], ['m2', 1, True, 0, 0]]
+        )
+        self.assertEqual(errors['char'].fillna('').tolist(), ['c', '2', ''])
+        self.assertEqual(errors['anomaly'].tolist(), ['unknown_char', 'duplicate_category', 'empty_segment'])
+        with self.assertRaisesRegex(ValueError, "m1 point 2: unknown_char 'c'"):
+            Shot.validate_points(df, strict=True)
+        points, errors = Shot.quarantine_points(df)
+        self.assertEqual(points['Pt'].tolist(), [1])
+        self.assertEqual(len(Shot.validate_points(df.iloc[:1])), 0)
+
+    def test_encode_points(self):
+        strs = pd.Series(['4f1*', float('nan'), '6b28f3@', None, '5n'])
+        encoded = Shot.encode_points(strs)
+        self.assertEqual(encoded['offsets'].tolist(), [0, 2, 2, 5, 5, 6])
+        self.assertEqual(encoded['point_idx'].tolist(), [0, 0, 2, 2, 2, 4])
+        self.assertEqual(encoded['shot_sequence_nbr'].tolist(), [0, 1, 0, 1, 2, 0])
+        self.assertEqual(encoded['is_return'].tolist(), [False, True, False, True, False, False])
+        serve_directions = list(ServeDirection)
+        self.assertEqual(
+            encoded['serve_direction'].tolist(),
+            [serve_directions.index(ServeDirection.wide), -1, serve_directions.index(ServeDirection.down_t), -1, -1,
+             serve_directions.index(ServeDirection.body)]
+        )
+        self.assertEqual(encoded['stroke_type'][[0, 2, 4]].tolist(), [-1, -1, list(StrokeType).index(StrokeType.forehand)])
+        self.assertEqual(encoded['shot_direction'][[0, 4]].tolist(), [-1, list(ShotDirection).index(ShotDirection.bh)])
+        self.assertEqual(encoded['return_depth'][3], list(ReturnDepth).index(ReturnDepth.middle))
+        self.assertEqual(encoded['error_type'][5], list(ErrorType).index(ErrorType.net))
+
+    def test_typed_points_reader(self):
+        # the explode no longer depends on column order, and only declared columns are read
+        df = pd.read_csv('test_data/points.csv', encoding='latin1').sample(100, random_state=0)
+        shuffled = df[list(reversed(df.columns))]
+        pd.testing.assert_frame_equal(Shot.explode_df(df.copy()), Shot.explode_df(shuffled.copy()))
+        typed = pd.read_csv('test_data/points.csv', **points_csv_kwargs(encoding='latin1'))
+        self.assertEqual(set(typed.columns), {'match_id', 'Pt', 'Svr', '1st', '2nd', 'PtWinner'})
+        self.assertEqual(str(typed['Pt'].dtype), 'int32')
+
+    def test_match_view(self):
+        df = pd.DataFrame({
+            'match_id': ['m1', 'm1', 'm2'],
+            'Pt': [1, 2, 1],
+            '1st': ['4f1*', '5n', '6b28f3@'],
+            '2nd': [float('nan'), '4s1f2d@', None],
+        })
+        matches = Match.from_df(df)
+        self.assertEqual(list(matches), ['m1', 'm2'])
+        self.assertEqual(len(matches['m1']), 2)
+        point = matches['m1'][1]
+        self.assertEqual(point.pt_nbr, 2)
+        self.assertEqual(len(point), 4)
+        self.assertEqual(list(point), Shot.parse_shots_string('5n') + Shot.parse_shots_string('4s1f2d@'))
+        self.assertEqual(point[-1], Shot.parse_shots_string('4s1f2d@')[-1])
+        self.assertEqual(point.second.shot_string(2), 'f2d@')
+        self.assertIsNone(matches['m1'][0].second)
+        self.assertEqual(matches['m2'][0][1:], Shot.parse_shots_string('6b28f3@')[1:])
+        self.assertEqual([p.pt_nbr for p in matches['m1'][-1:]], [2])
+        with self.assertRaises(IndexError):
+            Point('4f1*')[2]
+
+    def test_immutable_shot(self):
+        shot = Shot.parse_shot_string('f-3*')
+        with self.assertRaises(AttributeError):
+            shot.terminal = Terminal.error
+        self.assertEqual(hash(shot), hash(GroundStroke(StrokeType.forehand, ShotDirection.bh, CourtPosition.net, Terminal.winner)))
+        self.assertEqual(len({shot, Shot.parse_shot_string('f-3*'), Shot.parse_shot_string('f1')}), 2)
+        for s in ['4+', 's28', 'b1w#', 'o=1', 'f', '0']:
+            for is_return in (False, True):
+                shot = Shot.parse_shot_string(s, is_return)
+                self.assertEqual(Shot.from_code(shot.code), shot)
+                self.assertIs(type(Shot.from_code(shot.code)), type(shot))
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_parquet_export(self):
+        explode_df = Shot.explode_df(pd.read_csv('test_data/points.csv', encoding='latin1'), columnar=True)
+        with tempfile.TemporaryDirectory() as root:
+            index = export_points_csv(['test_data/points.csv'], root, chunksize=50, row_group_size=100, encoding='latin1')
+            self.assertEqual(index['n_rows'].sum(), len(explode_df))
+            self.assertEqual(len(read_shots(root)), len(explode_df))
+            match_id = explode_df['match_id'].iloc[-1]
+            match_df = read_match(root, match_id)
+            expected_df = explode_df[explode_df['match_id'] == match_id].reset_index(drop=True)
+            self.assertListEqual(match_df['raw_string'].tolist(), expected_df['raw_string'].tolist())
+            self.assertListEqual(match_df['stroke_type'].astype(object).tolist(), expected_df['stroke_type'].astype(object).tolist())
+
+    def test_parquet_export_again(self):
+        # exporting matches again replaces them, whether the whole file or only some of its matches come back
+        df = pd.read_csv('test_data/points.csv', encoding='latin1')
+        explode_df = Shot.explode_df(df, columnar=True)
+        match_id = explode_df['match_id'].iloc[-1]
+        with tempfile.TemporaryDirectory() as root:
+            first_index = export_points_csv(['test_data/points.csv'], root, chunksize=50, row_group_size=100, encoding='latin1')
+            index = export_points_csv(['test_data/points.csv'], root, chunksize=50, row_group_size=100, encoding='latin1')
+            self.assertEqual(len(index), len(first_index))
+            self.assertEqual(len(read_match(root, match_id)), (explode_df['match_id'] == match_id).sum())
+
+            some_matches = pathlib.Path(root) / 'some-points.csv'
+            df[df['match_id'].isin(df['match_id'].unique()[::2])].to_csv(some_matches, index=False)
+            index = export_points_csv([some_matches], root, chunksize=50, row_group_size=100)
+            self.assertEqual(index['match_id'].nunique(), len(index))
+            self.assertEqual(index['n_rows'].sum(), len(explode_df))
+            self.assertEqual(len(read_shots(root)), len(explode_df))
+            self.assertEqual(len(read_match(root, match_id)), (explode_df['match_id'] == match_id).sum())
+
+    def test_point_states(self):
+        points = [
+            ('4*', None, 1),        # ace
+            ('6n', '5d', 1),        # double fault
+            ('5f1b2*', None, 1),    # server's winner
+            ('4b1f2b3n@', None, 1), # returner's error
+            ('6#', None, 1),        # unreturned serve, game server
+            ('4f2b3n#', None, 2),   # server's forced error
+            ('6e', '4f1*', 2),      # 1st serve fault the parser has no code for, returner's winner on the 2nd
+        ]
+        df = pd.DataFrame({
+            'match_id': 'm',
+            'Pt': range(1, len(points) + 1),
+            'Svr': [svr for _, _, svr in points],
+            '1st': [first for first, _, _ in points],
+            '2nd': [second for _, second, _ in points],
+        })
+        states = point_states(df)
+        self.assertListEqual(states['point_winner'].tolist(), [1, 2, 1, 1, 1, 1, 1])
+        self.assertListEqual(states['serve_nbr'].tolist(), [1, 2, 1, 1, 1, 1, 2])
+        self.assertListEqual(states['rally_length'].tolist(), [1, 1, 3, 4, 1, 3, 2])
+        self.assertListEqual(
+            states['point_outcome'].tolist(), ['ace', 'double_fault', 'winner', 'error', 'unreturned', 'forced_error', 'winner']
+        )
+        self.assertListEqual(states['pts1'].tolist(), [0, 1, 1, 2, 3, 0, 1])
+        self.assertListEqual(states['pts2'].tolist(), [0, 0, 1, 1, 1, 0, 0])
+        self.assertListEqual(states['gm1'].tolist(), [0, 0, 0, 0, 0, 1, 1])
+
+        shots = annotate_shots(Shot.explode_df(df, columnar=True), states)
+        self.assertListEqual(shots[shots['pt_nbr'] == 6]['hitter'].tolist(), [2, 1, 2])
+
+    def test_match_stats_index(self):
+        df = pd.read_csv('test_data/points.csv', encoding='latin1')
+        shots = annotate_shots(Shot.explode_df(df, columnar=True), point_states(df))
+        match_ids = shots['match_id'].unique()
+        index = MatchStatsIndex()
+        index.add(shots[shots['match_id'].isin(match_ids[:3])])
+        index.add(shots[shots['match_id'].isin(match_ids[1:])])
+        self.assertEqual(len(index), 2 * len(match_ids))
+
+        winners = shots[(shots['stroke_type'] == 'forehand') & (shots['terminal'] == 'winner')]
+        expected = winners.groupby(['match_id', 'hitter']).size()
+        counts = index.counts_by(['match_id', 'player_nbr'], stroke_type='forehand', terminal='winner')
+        self.assertDictEqual(counts[counts > 0].to_dict(), expected.to_dict())
+        self.assertEqual(index.counts_by(['match_id'], return_depth=None).sum(), shots['return_depth'].isnull().sum())
+        with self.assertRaises(ValueError):
+            index.counts_by(serve_direction='wide', terminal='winner')
+
+    def test_shot_pattern_index(self):
+        df = pd.read_csv('test_data/points.csv', **points_csv_kwargs(encoding='latin1'))
+        shots = Shot.explode_df(df, columnar=True)
+        index = ShotPatternIndex()
+        for match in list(Match.from_df(df).values())[:3]:
+            index.add(match)
+        index.add_points(df)
+        self.assertEqual(len(index), df['match_id'].nunique())
+
+        found = index.find([{'stroke_type': 'forehand', 'terminal': 'winner'}])
+        winners = shots[(shots['stroke_type'] == 'forehand') & (shots['terminal'] == 'winner')]
+        self.assertListEqual(
+            sorted(zip(found['match_id'], found['pt_nbr'], found['first_pt'], found['shot_sequence_nbr'])),
+            sorted(zip(winners['match_id'], winners['pt_nbr'], winners['first_pt'], winners['shot_sequence_nbr']))
+        )
+
+        # a serve, any return, then a point ending winner or error
+        found = index.find([{'serve_direction': ['wide', 'body']}, None, {'terminal': ['winner', 'error']}], start=0, last=True)
+        expected = 0
+        for s in df['1st'].tolist() + df['2nd'].dropna().tolist():
+            point = Shot.parse_shots_string(s)
+            expected += len(point) == 3 and point[0].serve_direction in (ServeDirection.wide, ServeDirection.body) and \
+                point[2].terminal in (Terminal.winner, Terminal.error)
+        self.assertEqual(len(found), expected)
+        self.assertEqual(index.count([{'stroke_type': '*'}]), len(shots))
+        with self.assertRaises(ValueError):
+            index.find([{'stroke_type': 'wide'}])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index.save(pathlib.Path(tmp_dir) / 'patterns.pkl')
+            loaded = ShotPatternIndex.load(pathlib.Path(tmp_dir) / 'patterns.pkl')
+        pd.testing.assert_frame_equal(loaded.find([None, {'is_return': True}]), index.find([None, {'is_return': True}]))
+
+        # matches added one by one, some of them again after a query, find the same shots
+        single = ShotPatternIndex()
+        matches = list(Match.from_df(df).values())
+        for match in matches + matches[:5]:
+            single.add(match)
+            if match is matches[-1]:
+                self.assertEqual(single.count([{'stroke_type': '*'}]), len(shots))
+        self.assertEqual(len(single), len(index))
+        self.assertEqual(single.count([{'stroke_type': '*'}]), len(shots))
+        self.assertEqual(single.count([{'stroke_type': 'forehand', 'terminal': 'winner'}]), len(winners))
+        single.compact()
+        self.assertEqual(single.count([None, {'is_return': True}]), index.count([None, {'is_return': True}]))
+
+    def test_parser_import_is_light(self):
+        code = (
+            'import sys, tmcp_parser; tmcp_parser.Shot.parse_shots_string("4f1b2n@"); '
+            'print(sorted({"numpy", "pandas"} & set(sys.modules)))'
+        )
+        cwd = pathlib.Path(__file__).resolve().parent
+        output = subprocess.run([sys.executable, '-c', code], cwd=cwd, check=True, capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), '[]')
+
     def test_real_data(self):
         df = pd.read_csv('test_data/points.csv', encoding='latin1')
         for s in df['1st']:
@@ -157,4 +446,314 @@ class ParserTests(unittest.TestCase):
         self.assertEqual(shot_strs[5], 'o=1')
         self.assertEqual(shot_strs[6], 'r#')
 
+    def test_segment_keeps_unknown_chars(self):
+        s = '4c0fq'
+        shot_strs = Shot.segment_string(s)
+        self.assertEqual(shot_strs, ['4c0', 'f', 'q'])
+        shots = Shot.parse_shots_string(s)
+        self.assertEqual(shots[0], Serve(serve_direction=ServeDirection.unknown))
+        self.assertEqual(shots[2], GroundStroke(StrokeType.unknown))
+
+
+def match_id(match_nbr, male=True):
+    return f'2019{match_nbr:04d}-{"M" if male else "W"}-Open_{match_nbr % 4}-R32-Player_{match_nbr}-Player_{match_nbr + 1}'
+
+
+def write_matches_csv(datapath, n_matches=25, male=True, first_match=0):
+    rows = []
+    for match_nbr in range(first_match, n_matches):
+        rows.append({
+            'match_id': match_id(match_nbr, male),
+            'Player 1': f'Player {match_nbr} ',
+            'Player 2': f'Player {match_nbr + 1}',
+            'Pl 1 hand': 'R',
+            'Pl 2 hand': 'L',
+            'Gender': 'M' if male else 'W',
+            'Date': 20190101 + match_nbr % 28,
+            'Tournament': f'Open {match_nbr % 4}',
+            'Round': 'R32',
+            'Time': None,
+            'Court': None,
+            'Surface': 'Hard',
+            'Umpire': None,
+            'Best of': 3,
+            'Final TB?': 1,
+            'Charted by': 'tester',
+        })
+    match_path = pathlib.Path(datapath) / f'charting-{"m" if male else "f"}-matches.csv'
+    pd.DataFrame(rows).to_csv(match_path, index=False, mode='a' if first_match else 'w', header=not first_match)
+
+
+def write_points_csv(datapath, n_matches=25, male=True, first_match=0):
+    point_strs = [('4f1*', None), ('6n', '5b2f1b3@'), ('5+s28v1f-3*', None), ('4d', '6s17f1*'), ('6f29u27y-37n@', None)]
+    rows = []
+    for match_nbr in range(first_match, n_matches):
+        for pt in range(1, 3 * match_nbr % 7 + 2):
+            first, second = point_strs[(match_nbr + pt) % len(point_strs)]
+            rows.append({
+                'match_id': match_id(match_nbr, male),
+                'Pt': pt,
+                '1st': first,
+                '2nd': second,
+                'PtWinner': 1,
+            })
+    points_df = pd.DataFrame(rows)
+    points_path = pathlib.Path(datapath) / f'charting-{"m" if male else "f"}-points.csv'
+    points_df.to_csv(points_path, index=False, mode='a' if first_match else 'w', header=not first_match)
+    return points_df
+
+
+class DBLoaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.datapath = pathlib.Path(self.tmp_dir.name)
+        write_matches_csv(self.datapath)
+        self.points_df = write_points_csv(self.datapath)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def count(self, db, table):
+        with db.conn.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            return cursor.fetchall()[0][0]
+
+    def test_batched_inserts(self):
+        with SQLiteDBLoader(self.datapath, 'root', '', ':memory:', 'localhost', batch_size=10) as db:
+            db.insert_tournaments()
+            db.insert_players()
+            commits = db.conn.commits
+            db.insert_matches()
+            self.assertEqual(db.conn.commits - commits, 3)
+            self.assertEqual(self.count(db, 'tournament_d'), 4)
+            self.assertEqual(self.count(db, 'player_d'), 26)
+            self.assertEqual(self.count(db, 'match_f'), 25)
+            self.assertEqual(str(db.matches_df()['Surface'].dtype), MATCHES_DTYPES['Surface'])
+            self.assertEqual(len(db.dimension_ids('player_d', [])), 26)
+            self.assertEqual(len(db.dimension_ids('match_f', [])), 25)
+
+            db.insert_tournaments()
+            db.insert_players()
+            db.insert_matches()
+            self.assertEqual(self.count(db, 'player_d'), 26)
+            self.assertEqual(self.count(db, 'match_f'), 25)
+
+    def test_loader_prints_nothing(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), SQLiteDBLoader(self.datapath, 'root', 'secret', ':memory:', 'localhost') as db:
+            db.load(chunksize=5)
+        self.assertNotIn('secret', stdout.getvalue())
+
+    def test_load_data_infile(self):
+        with SQLiteDBLoader(self.datapath, 'root', '', ':memory:', 'localhost', load_data_infile=True) as db:
+            db.load(chunksize=5)
+            self.assertEqual(self.count(db, 'shot_f'), len(Shot.explode_df(self.points_df, columnar=True)))
+            files = db.conn.loaded_files
+        shot_rows = [line.split('\t') for table, text in files if table == 'shot_f' for line in text.splitlines()]
+        # first_pt and is_return
+        self.assertSetEqual({row[2] for row in shot_rows} | {row[10] for row in shot_rows}, {'0', '1'})
+        match_rows = [line.split('\t') for table, text in files if table == 'match_f' for line in text.splitlines()]
+        self.assertEqual(match_rows[0][-1], '2019-01-01')
+
+    def test_sync_dimension(self):
+        with SQLiteDBLoader(self.datapath, 'root', '', ':memory:', 'localhost', batch_size=10) as db:
+            db.insert_players()
+            round_trips = db.conn.round_trips
+            names = pd.Series(['player 0', ' PLAYER 1 ', 'New Player', 'new player ', None, 'Other'] * 100)
+            ids = db.sync_dimension('player_d', names, male=0)
+            # stage, 1 insert batch, insert-select, id join, drop
+            self.assertEqual(db.conn.round_trips - round_trips, 5)
+            self.assertEqual(self.count(db, 'player_d'), 28)
+            self.assertEqual(ids['new player'], db.dimension_ids('player_d', ['NEW PLAYER'])['new player'])
+            self.assertEqual(ids['player 0'], db.dimension_ids('player_d', ['Player 0'])['player 0'])
+
+            round_trips = db.conn.round_trips
+            db.sync_dimension('player_d', names, male=0)
+            self.assertEqual(db.conn.round_trips, round_trips)
+
+    def test_insert_shots(self):
+        with SQLiteDBLoader(self.datapath, 'root', '', ':memory:', 'localhost', batch_size=7) as db:
+            db.insert_tournaments()
+            db.insert_players()
+            db.insert_matches()
+            db.insert_shots(chunksize=5)
+            n_shots = len(Shot.explode_df(self.points_df, columnar=True))
+            self.assertEqual(self.count(db, 'shot_f'), n_shots)
+            db.insert_shots(chunksize=5)
+            self.assertEqual(self.count(db, 'shot_f'), n_shots)
+
+    def test_metrics(self):
+        events = []
+        metrics = tmcp_metrics.enable(callback=lambda kind, name, value: events.append((kind, name)))
+        try:
+            with SQLiteDBLoader(self.datapath, 'root', '', ':memory:', 'localhost', batch_size=7) as db:
+                db.insert_tournaments()
+                db.insert_players()
+                db.insert_matches()
+                db.insert_shots(chunksize=5)
+                n_shots = self.count(db, 'shot_f')
+        finally:
+            self.assertIs(tmcp_metrics.disable(), metrics)
+        summary = metrics.summary()
+        self.assertEqual(summary['counters']['shots_emitted'], n_shots)
+        self.assertEqual(summary['counters']['rows_read'], 25 + len(self.points_df))
+        self.assertEqual(summary['counters']['rows_written'], 4 + 26 + 25 + n_shots)
+        self.assertEqual(
+            summary['counters']['points_parsed'] + summary['counters']['cache_hits'],
+            len(self.points_df) + self.points_df['2nd'].notnull().sum()
+        )
+        for name in ['read_csv', 'explode_df.parse', 'db.write', 'insert_players', 'insert_shots']:
+            self.assertGreater(summary['timings'][name]['calls'], 0)
+        self.assertIn(('count', 'batches_committed'), events)
+
+        Shot.parse_shots_string('4f1*')
+        self.assertEqual(summary, metrics.summary() | {'elapsed': summary['elapsed']})
+
+    def test_quarantine(self):
+        points_path = self.datapath / 'charting-m-points.csv'
+        points = pd.read_csv(points_path)
+        points.loc[3, '1st'] = points.loc[3, '1st'] + '?'
+        points.to_csv(points_path, index=False)
+        with SQLiteDBLoader(self.datapath, 'root', '', ':memory:', 'localhost') as db:
+            db.insert_tournaments()
+            db.insert_players()
+            db.insert_matches()
+            db.insert_shots(chunksize=5, validate='quarantine')
+            self.assertEqual(len(db.anomalies), 1)
+            self.assertEqual(db.anomalies[0]['pt_nbr'].tolist(), [points.loc[3, 'Pt']])
+            self.assertEqual(self.count(db, 'shot_f'), len(Shot.explode_df(points.drop(3), columnar=True)))
+            with self.assertRaises(ValueError):
+                db.insert_shots(chunksize=5, validate='strict')
+
+    def test_both_tours(self):
+        write_matches_csv(self.datapath, male=False)
+        women_points = write_points_csv(self.datapath, n_matches=10, male=False)
+        with SQLiteDBLoader(self.datapath, 'root', '', ':memory:', 'localhost') as db:
+            men_stats = db.load(male=True, chunksize=5)
+            women_stats = db.load(male=False, chunksize=5)
+            self.assertEqual(men_stats['charting-m-points.csv']['rows'], len(self.points_df))
+            self.assertEqual(women_stats['charting-f-points.csv']['rows'], len(women_points))
+            self.assertEqual(
+                self.count(db, 'shot_f'),
+                men_stats['charting-m-points.csv']['shots'] + women_stats['charting-f-points.csv']['shots']
+            )
+
+    def test_cli_explode(self):
+        write_matches_csv(self.datapath, male=False)
+        write_points_csv(self.datapath, n_matches=10, male=False)
+        out_path = self.datapath / 'shots'
+        self.assertEqual(cli_main(['explode', '--data_path', str(self.datapath), '--out_path', str(out_path)]), 0)
+        self.assertEqual(
+            len(pd.read_csv(out_path / 'charting-m-points-shots.csv')),
+            len(Shot.explode_df(self.points_df, columnar=True))
+        )
+        self.assertTrue((out_path / 'charting-f-points-shots.csv').exists())
+        self.assertEqual(cli_main(['explode', '--data_path', str(self.datapath / 'missing'), '--out_path', str(out_path)]), 1)
+
+    def test_cli_load_without_matches(self):
+        # the women's tour has points but no matches file; it is reported before any database connection
+        write_points_csv(self.datapath, n_matches=10, male=False)
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr), contextlib.redirect_stdout(io.StringIO()):
+            result = cli_main([
+                'load', '--data_path', str(self.datapath), '--tours', 'f', '--p', '', '--host', 'localhost',
+                '--database', 'tennis'
+            ])
+        self.assertEqual(result, 0)
+        self.assertIn('no charting matches file for tour f', stderr.getvalue())
+
+    def test_incremental(self):
+        database = str(self.datapath / 'tennis.db')
+        for n_matches, n_new_matches in [(25, 25), (25, 0), (30, 5)]:
+            if n_new_matches and n_matches > 25:
+                write_matches_csv(self.datapath, n_matches, first_match=25)
+                self.points_df = pd.concat([self.points_df, write_points_csv(self.datapath, n_matches, first_match=25)])
+            with SQLiteDBLoader(self.datapath, 'root', '', database, 'localhost', incremental=True) as db:
+                db.insert_tournaments()
+                db.insert_players()
+                db.insert_matches()
+                db.insert_shots(chunksize=5)
+                self.assertEqual(len(db.matches_df()), n_new_matches)
+                self.assertEqual(self.count(db, 'match_f'), n_matches)
+                self.assertEqual(self.count(db, 'shot_f'), len(Shot.explode_df(self.points_df, columnar=True)))
+                self.assertEqual(db.checkpoints.checkpoints['charting-m-points.csv']['rows'], len(self.points_df))
+
+    def test_checkpoints_per_database(self):
+        # every database keeps its own checkpoints, so a second (or reset) database loads everything
+        n_shots = len(Shot.explode_df(self.points_df, columnar=True))
+        for database in ('tennis.db', 'tennis-copy.db', 'tennis.db'):
+            with SQLiteDBLoader(self.datapath, 'root', '', str(self.datapath / database), 'localhost', incremental=True) as db:
+                db.load(chunksize=5)
+                self.assertEqual(self.count(db, 'shot_f'), n_shots)
+        (self.datapath / 'tennis.db').unlink()
+        with SQLiteDBLoader(self.datapath, 'root', '', str(self.datapath / 'tennis.db'), 'localhost', incremental=True) as db:
+            self.assertDictEqual(db.checkpoints.checkpoints, {})
+            db.load(chunksize=5)
+            self.assertEqual(self.count(db, 'shot_f'), n_shots)
+
+    def test_quoted_newlines(self):
+        # a quoted field may span lines, e.g. charters' notes
+        points_path = self.datapath / 'charting-m-points.csv'
+        self.points_df.assign(Notes=['line one\nline two, "quoted"'] * len(self.points_df)).to_csv(points_path, index=False)
+        n_shots = len(Shot.explode_df(self.points_df, columnar=True))
+        for incremental in (False, True):
+            database = str(self.datapath / f'tennis-{incremental}.db')
+            with SQLiteDBLoader(self.datapath, 'root', '', database, 'localhost', incremental=incremental) as db:
+                stats = db.load(chunksize=3)
+                self.assertEqual(stats['charting-m-points.csv']['rows'], len(self.points_df))
+                self.assertEqual(self.count(db, 'shot_f'), n_shots)
+
+    def test_partial_last_line(self):
+        # an incremental run while the last line is still being written loads the points before it, then the
+        # next run picks the line up once it is complete
+        points_path = self.datapath / 'charting-m-points.csv'
+        data = points_path.read_bytes()
+        last_line = data.rindex(b'\n', 0, len(data) - 1) + 1
+        database = str(self.datapath / 'tennis.db')
+        for size, points, offset in [(len(data) - 3, self.points_df.iloc[:-1], last_line), (len(data), self.points_df, len(data))]:
+            points_path.write_bytes(data[:size])
+            with SQLiteDBLoader(self.datapath, 'root', '', database, 'localhost', incremental=True) as db:
+                db.load(chunksize=5)
+                self.assertEqual(self.count(db, 'shot_f'), len(Shot.explode_df(points, columnar=True)))
+                self.assertEqual(db.checkpoints.checkpoints['charting-m-points.csv']['offset'], offset)
+
+    def test_concurrent_writers(self):
+        database = str(self.datapath / 'tennis.db')
+        with SQLiteDBLoader(
+            self.datapath, 'root', '', database, 'localhost', batch_size=4, incremental=True, writers=3
+        ) as db:
+            db.insert_tournaments()
+            db.insert_players()
+            db.insert_matches()
+            db.insert_shots(chunksize=3)
+            self.assertEqual(self.count(db, 'shot_f'), len(Shot.explode_df(self.points_df, columnar=True)))
+            self.assertEqual(db.checkpoints.checkpoints['charting-m-points.csv']['rows'], len(self.points_df))
+
+    def test_concurrent_writers_rerun(self):
+        # a full run whose first shot batch fails while later batches commit, then plain reruns
+        database = str(self.datapath / 'tennis.db')
+        n_shots = len(Shot.explode_df(self.points_df, columnar=True))
+        with SQLiteDBLoader(self.datapath, 'root', '', database, 'localhost', writers=3) as db:
+            db.insert_tournaments()
+            db.insert_players()
+            db.insert_matches()
+            insert_rows = db._insert_rows
+            calls = itertools.count()
+            committed = threading.Event()
 
+            def fail_first(table, *args, **kwargs):
+                # the first shot batch fails only once a later one has committed
+                if table == 'shot_f' and next(calls) == 0:
+                    committed.wait(5)
+                    raise RuntimeError('lost connection')
+                insert_rows(table, *args, **kwargs)
+                committed.set()
+            db._insert_rows = fail_first
+            with self.assertRaises(RuntimeError):
+                db.insert_shots(chunksize=2)
+            self.assertLess(self.count(db, 'shot_f'), n_shots)
+        for writers in (1, 3):
+            with SQLiteDBLoader(self.datapath, 'root', '', database, 'localhost', writers=writers) as db:
+                db.insert_shots(chunksize=2)
+                self.assertEqual(self.count(db, 'shot_f'), n_shots)
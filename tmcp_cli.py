@@ -0,0 +1,226 @@
+import argparse
+import concurrent.futures
+import pathlib
+import sys
+import time
+
+import pandas as pd
+
+import tmcp_metrics
+from tmcp_parser import Shot
+from tmcp_schema import charting_files
+
+
+def _file_stats(path, shots, seconds, **extra):
+    return dict(file=pathlib.Path(path).name, mb=pathlib.Path(path).stat().st_size / 2 ** 20, shots=shots,
+                seconds=seconds, **extra)
+
+
+def report(stats):
+    # one throughput line per file, then the totals
+    line = (
+        '{file:<40} {mb:>9.1f} MB {shots:>11} shots {seconds:>9.2f}s {shots_per_sec:>11.0f} shots/s '
+        '{mb_per_sec:>7.1f} MB/s'
+    )
+    for file_stats in stats:
+        seconds = max(file_stats['seconds'], 1e-9)
+        print(line.format(
+            shots_per_sec=file_stats['shots'] / seconds, mb_per_sec=file_stats['mb'] / seconds, **file_stats
+        ))
+    total = dict(
+        file=f'total ({len(stats)} files)',
+        mb=sum(file_stats['mb'] for file_stats in stats),
+        shots=sum(file_stats['shots'] for file_stats in stats),
+        seconds=max(sum(file_stats['seconds'] for file_stats in stats), 1e-9),
+    )
+    print(line.format(
+        shots_per_sec=total['shots'] / total['seconds'], mb_per_sec=total['mb'] / total['seconds'], **total
+    ))
+
+
+def explode_file(points_path, out_path, chunksize):
+    # explodes one points file into out_path/<points file stem>-shots.csv
+    start = time.perf_counter()
+    shots_path = pathlib.Path(out_path) / f'{pathlib.Path(points_path).stem}-shots.csv'
+    n_shots = 0
+    for shots in Shot.iter_explode_csv(points_path, chunksize=chunksize, columnar=True, encoding='latin1'):
+        shots.to_csv(shots_path, index=False, mode='a' if n_shots else 'w', header=not n_shots)
+        n_shots += len(shots)
+    return _file_stats(points_path, n_shots, time.perf_counter() - start)
+
+
+def explode(args, files):
+    # files are independent here, so each worker process explodes whole files
+    pathlib.Path(args.out_path).mkdir(parents=True, exist_ok=True)
+    points_paths = [points_path for tour_files in files.values() for points_path in tour_files['points']]
+    if args.workers <= 1:
+        return [explode_file(points_path, args.out_path, args.chunksize) for points_path in points_paths]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(explode_file, points_path, args.out_path, args.chunksize) for points_path in points_paths]
+        return [future.result() for future in futures]
+
+
+def export(args, files):
+    # every file writes into the same partitioned dataset and match index, so files go one at a time and the
+    # workers explode each chunk in parallel
+    from tmcp_export import export_shots
+
+    def shot_frames(points_path, counts):
+        for shots in Shot.iter_explode_csv(
+            points_path, chunksize=args.chunksize, columnar=True, workers=args.workers, encoding='latin1'
+        ):
+            counts.append(len(shots))
+            yield shots
+
+    stats = []
+    for tour_files in files.values():
+        for points_path in tour_files['points']:
+            start = time.perf_counter()
+            counts = []
+            export_shots(shot_frames(points_path, counts), args.out_path)
+            stats.append(_file_stats(points_path, sum(counts), time.perf_counter() - start))
+    return stats
+
+
+def load(args, files):
+    # tours load one after the other (they share the dimension tables and the checkpoint table); within a tour
+    # --workers writer threads insert shots concurrently
+    from insert_db import DBLoader
+
+    # shots need their match rows, so a tour with points files but no matches file is reported and skipped
+    for tour, tour_files in files.items():
+        if tour_files['matches'] is None:
+            print(f'no charting matches file for tour {tour} in {args.data_path}, skipping its points files',
+                  file=sys.stderr)
+    files = {tour: tour_files for tour, tour_files in files.items() if tour_files['matches'] is not None}
+    stats = []
+    if not files:
+        return stats
+    with DBLoader(
+        args.data_path, args.u, args.p, args.database, args.host, args.batch_size, args.load_data_infile,
+        args.incremental, args.workers
+    ) as db:
+        for tour in files:
+            file_stats = db.load(male=tour == 'm', chunksize=args.chunksize, validate=args.validate)
+            stats.extend(
+                _file_stats(pathlib.Path(args.data_path) / name, s['shots'], s['seconds'], rows=s['rows'])
+                for name, s in file_stats.items()
+            )
+    if db.anomalies:
+        quarantine_path = pathlib.Path(args.data_path) / 'quarantined-points.csv'
+        pd.concat(db.anomalies, ignore_index=True).to_csv(
+            quarantine_path, index=False, mode='a', header=not quarantine_path.exists()
+        )
+    return stats
+
+
+COMMANDS = {
+    'explode': explode,
+    'export': export,
+    'load': load,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='explode, export or load every MCP charting file under --data_path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        '--data_path',
+        type=str,
+        required=True
+    )
+    common.add_argument(
+        '--tours',
+        default='m,f',
+        type=str,
+        help='comma separated charting file tags: m, f'
+    )
+    common.add_argument(
+        '--workers',
+        default=1,
+        type=int
+    )
+    common.add_argument(
+        '--chunksize',
+        default=100000,
+        type=int
+    )
+    common.add_argument(
+        '--metrics',
+        type=str,
+        help='write per-stage timings and counters to this JSON file at exit'
+    )
+
+    for command in ('explode', 'export'):
+        subparser = subparsers.add_parser(command, parents=[common])
+        subparser.add_argument(
+            '--out_path',
+            type=str,
+            required=True
+        )
+
+    subparser = subparsers.add_parser('load', parents=[common], help='--workers is the number of shot writers')
+    subparser.add_argument(
+        '--writers',
+        dest='workers',
+        default=argparse.SUPPRESS,
+        type=int,
+        help=argparse.SUPPRESS
+    )
+    subparser.add_argument(
+        '--u',
+        default='root',
+        type=str
+    )
+    subparser.add_argument(
+        '--p',
+        type=str,
+        required=True
+    )
+    subparser.add_argument(
+        '--host',
+        type=str,
+        required=True
+    )
+    subparser.add_argument(
+        '--database',
+        type=str,
+        required=True
+    )
+    subparser.add_argument(
+        '--batch_size',
+        default=10000,
+        type=int
+    )
+    subparser.add_argument(
+        '--load_data_infile',
+        action='store_true'
+    )
+    subparser.add_argument(
+        '--incremental',
+        action='store_true'
+    )
+    subparser.add_argument(
+        '--validate',
+        choices=['strict', 'quarantine']
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics:
+        tmcp_metrics.enable(summary_path=args.metrics)
+    tours = args.tours.split(',')
+    files = {tour: tour_files for tour, tour_files in charting_files(args.data_path).items() if tour in tours}
+    if not files:
+        print(f'no charting files for tours {args.tours} in {args.data_path}', file=sys.stderr)
+        return 1
+    stats = COMMANDS[args.command](args, files)
+    report(stats)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import pathlib
+from typing import Iterable, List
+
+import pandas as pd
+
+from tmcp_parser import Shot
+
+
+INDEX_FILE = 'match_index.parquet'
+
+
+def _pyarrow():
+    # pyarrow is only needed for the Parquet export, so it is imported on first use
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('Parquet export needs pyarrow (pip install pyarrow)') from e
+    return pyarrow, pyarrow.parquet
+
+
+def match_tour(match_id: str) -> str:
+    # MCP match ids look like 20190101-M-Brisbane-R32-Player_One-Player_Two
+    return match_id.split('-')[1]
+
+
+def match_year(match_id: str) -> str:
+    return match_id[:4]
+
+
+def export_shots(shot_frames: Iterable[pd.DataFrame], root, row_group_size: int = 100000) -> pd.DataFrame:
+    # writes exploded shots (Shot.explode_df(..., columnar=True) output, enum columns become dictionary encoded)
+    # to root/tour=<M|W>/year=<yyyy>/part-<n>.parquet. Every file covers a sorted match_id range, row groups never
+    # split a match, and root/match_index.parquet maps each match_id to its file, row group and row offset.
+    # A match exported again replaces the copy already under root: older files holding it are rewritten without
+    # it, or removed once they hold nothing else.
+    pa, pq = _pyarrow()
+    root = pathlib.Path(root)
+    index_path = root / INDEX_FILE
+    index_frames = [pq.read_table(index_path).to_pandas()] if index_path.exists() else []
+    part_nbrs = [int(path.stem.split('-')[-1]) for path in root.glob('tour=*/year=*/part-*.parquet')]
+    part_nbr = max(part_nbrs) + 1 if part_nbrs else 0
+
+    for shots in shot_frames:
+        if len(shots) == 0:
+            continue
+        match_ids = shots['match_id'].astype(str)
+        partitions = pd.DataFrame({'tour': match_ids.map(match_tour), 'year': match_ids.map(match_year)})
+        for (tour, year), partition in shots.groupby([partitions['tour'], partitions['year']], sort=True):
+            partition = partition.sort_values('match_id', kind='stable').reset_index(drop=True)
+            rel_path = pathlib.Path(f'tour={tour}') / f'year={year}' / f'part-{part_nbr:05d}.parquet'
+            part_nbr += 1
+            (root / rel_path).parent.mkdir(parents=True, exist_ok=True)
+            entries = _write_partition(pa, pq, partition, root / rel_path, row_group_size)
+            entries['path'] = str(rel_path)
+            entries['tour'] = tour
+            entries['year'] = year
+            index_frames.append(entries)
+
+    index = pd.concat(index_frames, ignore_index=True) if index_frames else pd.DataFrame(
+        columns=['match_id', 'row_group', 'row_offset', 'n_rows', 'path', 'tour', 'year']
+    )
+    index = _drop_replaced(pa, pq, root, index, row_group_size)
+    root.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(index, preserve_index=False), index_path)
+    return index
+
+
+def _drop_replaced(pa, pq, root: pathlib.Path, index: pd.DataFrame, row_group_size: int) -> pd.DataFrame:
+    # a match lives in the file of its last index entry; every other file holding it is rewritten without it
+    # (or removed when nothing is left) and the index rows of those files are rebuilt
+    latest_path = index.drop_duplicates('match_id', keep='last').set_index('match_id')['path']
+    stale = index['path'].to_numpy() != index['match_id'].map(latest_path).to_numpy()
+    if not stale.any():
+        return index
+    stale_paths = index.loc[stale, 'path'].unique()
+    kept = index[~index['path'].isin(stale_paths)]
+    rewritten = []
+    for rel_path in stale_paths:
+        keep_ids = index.loc[(index['path'] == rel_path) & ~stale, 'match_id']
+        path = root / rel_path
+        if len(keep_ids) == 0:
+            path.unlink()
+            continue
+        table = pq.read_table(path)
+        partition = table.filter(pa.compute.is_in(table['match_id'], value_set=pa.array(keep_ids.tolist(), type=table['match_id'].type))).to_pandas()
+        tmp_path = path.with_name(path.name + '.tmp')
+        entries = _write_partition(pa, pq, partition, tmp_path, row_group_size)
+        tmp_path.replace(path)
+        entries['path'] = rel_path
+        entries['tour'], entries['year'] = index.loc[index['path'] == rel_path, ['tour', 'year']].iloc[0]
+        rewritten.append(entries)
+    return pd.concat([kept] + rewritten, ignore_index=True)
+
+
+def _write_partition(pa, pq, partition: pd.DataFrame, path: pathlib.Path, row_group_size: int) -> pd.DataFrame:
+    match_sizes = partition.groupby('match_id', sort=False).size()
+    table = pa.Table.from_pandas(partition, preserve_index=False)
+    entries = []
+    with pq.ParquetWriter(path, table.schema) as writer:
+        row_group = 0
+        group_start = 0
+        group_rows = 0
+        for match_id, n_rows in match_sizes.items():
+            entries.append((match_id, row_group, group_rows, n_rows))
+            group_rows += n_rows
+            if group_rows >= row_group_size:
+                writer.write_table(table.slice(group_start, group_rows), row_group_size=group_rows)
+                row_group += 1
+                group_start += group_rows
+                group_rows = 0
+        if group_rows > 0:
+            writer.write_table(table.slice(group_start, group_rows), row_group_size=group_rows)
+    return pd.DataFrame(entries, columns=['match_id', 'row_group', 'row_offset', 'n_rows'])
+
+
+def export_points_csv(points_paths: List, root, chunksize: int = 100000, row_group_size: int = 100000,
+                      workers: int = 1, **read_csv_kwargs) -> pd.DataFrame:
+    def shot_frames():
+        for points_path in points_paths:
+            yield from Shot.iter_explode_csv(
+                points_path, chunksize=chunksize, columnar=True, workers=workers, **read_csv_kwargs
+            )
+    return export_shots(shot_frames(), root, row_group_size=row_group_size)
+
+
+def read_match(root, match_id: str) -> pd.DataFrame:
+    # reads only the row group(s) holding one match
+    pa, pq = _pyarrow()
+    root = pathlib.Path(root)
+    index = pq.read_table(root / INDEX_FILE, filters=[('match_id', '=', match_id)]).to_pandas()
+    tables = []
+    for entry in index.itertuples():
+        row_group = pq.ParquetFile(root / entry.path, memory_map=True).read_row_group(entry.row_group)
+        tables.append(row_group.slice(entry.row_offset, entry.n_rows))
+    if not tables:
+        raise KeyError(match_id)
+    return pa.concat_tables(tables).to_pandas()
+
+
+def read_shots(root, tour: str = None, year=None) -> pd.DataFrame:
+    # memory-mapped read of a whole tour and/or season
+    _, pq = _pyarrow()
+    root = pathlib.Path(root)
+    paths = sorted(root.glob(f'tour={tour or "*"}/year={year or "*"}/part-*.parquet'))
+    if not paths:
+        return pd.DataFrame()
+    return pd.concat([pq.read_table(path, memory_map=True).to_pandas() for path in paths], ignore_index=True)
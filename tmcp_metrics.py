@@ -0,0 +1,105 @@
+import atexit
+import contextlib
+import functools
+import json
+import pathlib
+import threading
+import time
+
+
+class Metrics(object):
+    # wall time per stage and event counters; callback(kind, name, value) is called for every update, kind
+    # being 'timer' (value in seconds) or 'count'. Updates may come from DBLoader writer threads.
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.timings = {}
+        self.calls = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        if self.callback is not None:
+            self.callback('count', name, n)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.timings[name] = self.timings.get(name, 0.0) + seconds
+                self.calls[name] = self.calls.get(name, 0) + 1
+            if self.callback is not None:
+                self.callback('timer', name, seconds)
+
+    def summary(self):
+        with self.lock:
+            return {
+                'elapsed': time.perf_counter() - self.started,
+                'timings': {name: {'seconds': seconds, 'calls': self.calls[name]} for name, seconds in self.timings.items()},
+                'counters': dict(self.counters),
+            }
+
+    def dump(self, path):
+        pathlib.Path(path).write_text(json.dumps(self.summary(), indent=2))
+
+
+# the enabled Metrics, None when instrumentation is off; hot paths only ever test this for None
+active = None
+
+_NO_TIMER = contextlib.nullcontext()
+
+
+def enable(callback=None, summary_path=None) -> Metrics:
+    # starts collecting into a fresh Metrics; with summary_path its JSON summary is written at exit
+    global active
+    active = Metrics(callback)
+    if summary_path is not None:
+        atexit.register(active.dump, summary_path)
+    return active
+
+
+def disable():
+    global active
+    metrics, active = active, None
+    return metrics
+
+
+def timer(name):
+    return _NO_TIMER if active is None else active.timer(name)
+
+
+def count(name, n=1):
+    if active is not None:
+        active.count(name, n)
+
+
+def timed(name):
+    # times every call of the decorated function while metrics are enabled
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if active is None:
+                return f(*args, **kwargs)
+            with active.timer(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(iterable, name):
+    # times how long each item of iterable takes to produce, e.g. the CSV reads behind a chunk generator
+    iterator = iter(iterable)
+    while True:
+        with timer(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
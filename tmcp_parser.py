@@ -1,8 +1,17 @@
 
 from enum import Enum
-from typing import List
+from functools import lru_cache
+from itertools import repeat
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
 
-import pandas as pd
+import tmcp_metrics
+from tmcp_schema import points_csv_kwargs
+
+# numpy and pandas are only imported by the DataFrame and array functions that use them, so parsing point
+# strings (the enums, Shot, Rally/Point/Match) stays cheap to import
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
 
 class ErrorType(Enum):
@@ -66,54 +75,413 @@ class CourtPosition(Enum):
     baseline = '='
 
 
+# Code table built once at import: every character maps to the (field slot, member index) pairs it
+# encodes. When a shot carries several codes of one field, the member defined last in its enum wins.
+_FIELD_ENUMS = (Terminal, StrokeType, ReturnDepth, CourtPosition, ShotDirection, ServeDirection, ErrorType)
+_FIELD_MEMBERS = tuple(tuple(enum) for enum in _FIELD_ENUMS)
+_N_FIELDS = len(_FIELD_ENUMS)
+
+
+def _build_code_table() -> Dict[str, Tuple[Tuple[int, int], ...]]:
+    table = {}
+    for slot, members in enumerate(_FIELD_MEMBERS):
+        for code, member in enumerate(members):
+            c = str(member.value)
+            table[c] = table.get(c, ()) + ((slot, code), )
+    return table
+
+
+_CODE_TABLE = _build_code_table()
+_SHOT_STARTS = frozenset(str(stroke_type.value) for stroke_type in StrokeType)
+
+
+def _classify(s: str) -> Tuple[int, ...]:
+    codes = [-1] * _N_FIELDS
+    for c in s:
+        for slot, code in _CODE_TABLE.get(c, ()):
+            if code > codes[slot]:
+                codes[slot] = code
+    return tuple(codes)
+
+
+def _tokenize(s: str) -> Tuple[Tuple[str, Tuple[int, ...]], ...]:
+    # segments and classifies in one left-to-right pass; every stroke letter after the first character
+    # opens a new shot, anything else (including unknown characters) stays with the current shot
+    segments = []
+    start_pos = 0
+    codes = [-1] * _N_FIELDS
+    for curr_pos, c in enumerate(s):
+        if curr_pos > 0 and c in _SHOT_STARTS:
+            segments.append((s[start_pos: curr_pos], tuple(codes)))
+            start_pos = curr_pos
+            codes = [-1] * _N_FIELDS
+        for slot, code in _CODE_TABLE.get(c, ()):
+            if code > codes[slot]:
+                codes[slot] = code
+    segments.append((s[start_pos:], tuple(codes)))
+    return tuple(segments)
+
+
+def _parse_shots(s: str) -> Tuple['Shot', ...]:
+    return tuple(Shot._from_codes(sub_str, codes, position == 1) for position, (sub_str, codes) in enumerate(_tokenize(s)))
+
+
+def _parse_shot(s: str, is_return: bool) -> 'Shot':
+    return Shot._from_codes(s, _classify(s), is_return)
+
+
+# shots are immutable, so cached results are shared between callers
+_PARSE_CACHE_SIZE = 2 ** 16
+_cached_parse_shots = lru_cache(maxsize=_PARSE_CACHE_SIZE)(_parse_shots)
+_cached_parse_shot = lru_cache(maxsize=_PARSE_CACHE_SIZE)(_parse_shot)
+
+
+# columns written by Shot.explode_df, in Shot.to_dict order
+_EXPLODE_ENUMS = (
+    ('court_position', CourtPosition),
+    ('terminal', Terminal),
+    ('error_type', ErrorType),
+    ('serve_direction', ServeDirection),
+    ('stroke_type', StrokeType),
+    ('return_depth', ReturnDepth),
+)
+
+# columns of Shot.encode_points: the explode_df enums plus shot_direction, which explode_df does not write
+_ENCODED_ENUMS = _EXPLODE_ENUMS + (('shot_direction', ShotDirection), )
+
+
+def _encode_point(s: str) -> Tuple[List[str], List[Tuple[int, ...]]]:
+    # one row per shot of (court_position, terminal, error_type, serve_direction, stroke_type, return_depth,
+    # shot_direction, is_return) with -1 for missing fields, masked the same way the Serve/GroundStroke/Return
+    # split masks them
+    sub_strs = []
+    rows = []
+    for position, (sub_str, codes) in enumerate(_tokenize(s)):
+        assert len(sub_str) > 0
+        terminal, stroke_type, return_depth, court_position, shot_direction, serve_direction, error = codes
+        if position == 1 or return_depth >= 0:
+            rows.append((court_position, terminal, error, -1, stroke_type, return_depth, shot_direction, 1))
+        elif serve_direction >= 0:
+            rows.append((court_position, terminal, error, serve_direction, -1, -1, -1, 0))
+        else:
+            rows.append((court_position, terminal, error, -1, stroke_type, -1, shot_direction, 0))
+        sub_strs.append(sub_str)
+    return sub_strs, rows
+
+
+def _encode_points(point_strs: 'np.ndarray'):
+    # encodes every distinct string once; missing strings (None/NaN) have no shots. Returns the code rows and
+    # sub strings of the distinct strings plus, per shot of point_strs, its point and the row to gather.
+    import numpy as np
+    import pandas as pd
+
+    point_codes, unique_strs = pd.factorize(point_strs)
+    sub_strs = []
+    rows = []
+    # one extra zero length slot, indexed by the -1 code of missing strings
+    unique_lens = np.zeros(len(unique_strs) + 1, dtype=np.int64)
+    for unique_nbr, s in enumerate(unique_strs):
+        point_sub_strs, point_rows = _encode_point(s)
+        sub_strs.extend(point_sub_strs)
+        rows.extend(point_rows)
+        unique_lens[unique_nbr] = len(point_rows)
+    unique_starts = np.cumsum(unique_lens) - unique_lens
+    tmcp_metrics.count('points_parsed', len(unique_strs))
+    tmcp_metrics.count('cache_hits', int((point_codes >= 0).sum()) - len(unique_strs))
+
+    shot_counts = unique_lens[point_codes]
+    point_of_shot = np.repeat(np.arange(len(point_codes)), shot_counts)
+    shot_sequence_nbr = np.arange(shot_counts.sum()) - np.repeat(np.cumsum(shot_counts) - shot_counts, shot_counts)
+    gather = unique_starts[point_codes][point_of_shot] + shot_sequence_nbr
+    codes = np.array(rows, dtype=np.int8).reshape(-1, len(_ENCODED_ENUMS) + 1)
+    return codes, sub_strs, shot_counts, point_of_shot, shot_sequence_nbr, gather
+
+
+# what Shot.validate_points reports: characters no field knows (the parser ignores them), a field coded more than
+# once in one shot (the parser keeps the member defined last) and empty or missing point strings (the parser asserts)
+ANOMALIES = ['unknown_char', 'duplicate_category', 'empty_segment']
+
+
+def _point_anomalies(s) -> List[Tuple[int, int, int]]:
+    # (shot sequence nbr, character position, ANOMALIES index) of every anomaly in one point string
+    if not isinstance(s, str) or len(s) == 0:
+        return [(0, 0, 2)]
+    anomalies = []
+    shot_sequence_nbr = 0
+    seen_slots = set()
+    for pos, c in enumerate(s):
+        if pos > 0 and c in _SHOT_STARTS:
+            shot_sequence_nbr += 1
+            seen_slots = set()
+        entries = _CODE_TABLE.get(c)
+        if entries is None:
+            anomalies.append((shot_sequence_nbr, pos, 0))
+            continue
+        if any(slot in seen_slots for slot, _ in entries):
+            anomalies.append((shot_sequence_nbr, pos, 1))
+        seen_slots.update(slot for slot, _ in entries)
+    return anomalies
+
+
 class Shot(object):
 
+    __slots__ = (
+        'court_position', 'terminal', 'error_type', 'serve_direction', 'stroke_type', 'shot_direction', 'return_depth',
+        'is_return', 'raw_string'
+    )
+
     def __init__(self, court_position: CourtPosition, terminal: Terminal = None, error: ErrorType = None, raw_string=None):
-        self.court_position = court_position
-        self.terminal = terminal
-        self.error_type = error
-        self.raw_string = raw_string
-        self.serve_direction = None
-        self.stroke_type = None
-        self.return_depth = None
-        self.is_return = None
+        self._set_fields(court_position=court_position, terminal=terminal, error_type=error, raw_string=raw_string)
+
+    def _set_fields(self, court_position=None, terminal=None, error_type=None, serve_direction=None, stroke_type=None,
+                    shot_direction=None, return_depth=None, is_return=None, raw_string=None):
+        object.__setattr__(self, 'court_position', court_position)
+        object.__setattr__(self, 'terminal', terminal)
+        object.__setattr__(self, 'error_type', error_type)
+        object.__setattr__(self, 'serve_direction', serve_direction)
+        object.__setattr__(self, 'stroke_type', stroke_type)
+        object.__setattr__(self, 'shot_direction', shot_direction)
+        object.__setattr__(self, 'return_depth', return_depth)
+        object.__setattr__(self, 'is_return', is_return)
+        object.__setattr__(self, 'raw_string', raw_string)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __delattr__(self, key):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __reduce__(self):
+        return Shot.from_code, (self.code, self.raw_string)
+
+    def _fields(self) -> tuple:
+        return (
+            self.court_position, self.terminal, self.error_type, self.serve_direction, self.stroke_type,
+            self.shot_direction, self.return_depth, self.is_return
+        )
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            self_dict = {k: v for k, v in self.__dict__.items() if k != 'raw_string'}
-            other_dict = {k: v for k, v in other.__dict__.items() if k != 'raw_string'}
-            return self_dict == other_dict
+            return self._fields() == other._fields()
         else:
             return False
 
+    def __hash__(self):
+        return hash(self._fields())
+
+    @property
+    def code(self) -> int:
+        # packs the shot class and every enum field into one small int, raw_string is not kept
+        code = _SHOT_KINDS.index(self.__class__)
+        for field_nbr, (name, _) in enumerate(_PACKED_FIELDS):
+            member = getattr(self, name)
+            if member is not None:
+                code |= (_PACKED_INDEX[member] + 1) << (_KIND_BITS + _FIELD_BITS * field_nbr)
+        return code
+
     @staticmethod
-    def explode_df(df: pd.DataFrame) -> pd.DataFrame:
-        df['has_second'] = False
-        df.loc[df['2nd'].notnull(), 'has_second'] = True
-        shot_dicts = []
-        for row in df.itertuples():
-            match_details = {
-                'match_id': row.match_id,
-                'pt_nbr': row.Pt,
-                'first_pt': True
-            }
-            shots = Shot.parse_shots_string(row._15)
-            for shot_sequence_nbr, shot in enumerate(shots):
-                shot_dict = shot.to_dict()
-                shot_dict.update(match_details)
-                shot_dict['shot_sequence_nbr'] = shot_sequence_nbr
-                shot_dicts.append(shot_dict)
+    def from_code(code: int, raw_string=None) -> 'Shot':
+        shot = object.__new__(_SHOT_KINDS[code & ((1 << _KIND_BITS) - 1)])
+        fields = {}
+        for field_nbr, (name, enum) in enumerate(_PACKED_FIELDS):
+            index = (code >> (_KIND_BITS + _FIELD_BITS * field_nbr)) & ((1 << _FIELD_BITS) - 1)
+            fields[name] = _PACKED_MEMBERS[enum][index - 1] if index else None
+        shot._set_fields(is_return=True if isinstance(shot, Return) else None, raw_string=raw_string, **fields)
+        return shot
 
-            if row.has_second:
+    @staticmethod
+    def explode_df(df: 'pd.DataFrame', columnar: bool = False, workers: int = 1) -> 'pd.DataFrame':
+        if workers > 1:
+            return Shot._explode_parallel(df, columnar, workers)
+        if columnar:
+            return Shot._explode_columnar(df)
+        import pandas as pd
 
-                shots = Shot.parse_shots_string(row._16)
+        shot_dicts = []
+        with tmcp_metrics.timer('explode_df.parse'):
+            points = zip(df['match_id'], df['Pt'], df['1st'], df['2nd'], df['2nd'].notnull())
+            for match_id, pt_nbr, first, second, has_second in points:
+                match_details = {
+                    'match_id': match_id,
+                    'pt_nbr': pt_nbr,
+                    'first_pt': True
+                }
+                shots = Shot.parse_shots_string(first)
                 for shot_sequence_nbr, shot in enumerate(shots):
                     shot_dict = shot.to_dict()
                     shot_dict.update(match_details)
                     shot_dict['shot_sequence_nbr'] = shot_sequence_nbr
-                    shot_dict['first_pt'] = False
                     shot_dicts.append(shot_dict)
-        return pd.DataFrame(shot_dicts)
+
+                if has_second:
+
+                    shots = Shot.parse_shots_string(second)
+                    for shot_sequence_nbr, shot in enumerate(shots):
+                        shot_dict = shot.to_dict()
+                        shot_dict.update(match_details)
+                        shot_dict['shot_sequence_nbr'] = shot_sequence_nbr
+                        shot_dict['first_pt'] = False
+                        shot_dicts.append(shot_dict)
+        tmcp_metrics.count('shots_emitted', len(shot_dicts))
+        with tmcp_metrics.timer('explode_df.frame'):
+            # enum columns are cast to object with None for missing fields explicitly, so neither the dtypes nor the
+            # nulls depend on which rows are exploded (e.g. the chunks of a parallel explode) or on the pandas
+            # version (pandas 3 infers str with NaN, astype(str) writes 'None' before it)
+            shots = pd.DataFrame(shot_dicts)
+            enums = [name for name, _ in _EXPLODE_ENUMS if name in shots.columns]
+            shots[enums] = shots[enums].astype(object).where(shots[enums].notnull(), None)
+            return shots
+
+    @staticmethod
+    def iter_explode_csv(path, chunksize: int = 100000, columnar: bool = False, workers: int = 1,
+                         **read_csv_kwargs) -> Iterator['pd.DataFrame']:
+        # reads the points file chunksize rows at a time; the rows of the last match in a chunk are held back
+        # until the next chunk so a match (and so every point) is always exploded in one piece. Columns and dtypes
+        # come from tmcp_schema.POINTS_DTYPES unless read_csv_kwargs overrides them.
+        import numpy as np
+        import pandas as pd
+
+        pending = None
+        for chunk in pd.read_csv(path, chunksize=chunksize, **points_csv_kwargs(**read_csv_kwargs)):
+            if len(chunk) == 0:
+                continue
+            if pending is not None:
+                chunk = pd.concat([pending, chunk], ignore_index=True)
+            match_ids = chunk['match_id'].to_numpy()
+            earlier_rows = np.flatnonzero(match_ids != match_ids[-1])
+            split = earlier_rows[-1] + 1 if len(earlier_rows) else 0
+            pending = chunk.iloc[split:]
+            if split > 0:
+                yield Shot.explode_df(chunk.iloc[:split].copy(), columnar, workers)
+        if pending is not None and len(pending) > 0:
+            yield Shot.explode_df(pending.copy(), columnar, workers)
+
+    @staticmethod
+    def _explode_parallel(df: 'pd.DataFrame', columnar: bool, workers: int) -> 'pd.DataFrame':
+        # contiguous row chunks cut on match_id changes, so concatenating them in order reproduces the serial output
+        from concurrent.futures import ProcessPoolExecutor
+
+        import numpy as np
+        import pandas as pd
+
+        match_starts = np.flatnonzero(df['match_id'].ne(df['match_id'].shift()).to_numpy())
+        n_chunks = min(len(match_starts), 4 * workers)
+        if n_chunks <= 1:
+            return Shot.explode_df(df, columnar)
+        bounds = match_starts[np.linspace(0, len(match_starts), n_chunks, endpoint=False).astype(int)].tolist() + [len(df)]
+        chunks = [df.iloc[start: stop].copy() for start, stop in zip(bounds[:-1], bounds[1:])]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            exploded = list(pool.map(Shot.explode_df, chunks, repeat(columnar)))
+        return pd.concat(exploded, ignore_index=True)
+
+    @staticmethod
+    def _explode_columnar(df: 'pd.DataFrame') -> 'pd.DataFrame':
+        # same columns as the row-wise path, but enum columns come back as Categoricals and no per-shot
+        # objects are built: each distinct point string is encoded once and shots are gathered with numpy
+        import numpy as np
+        import pandas as pd
+
+        n_rows = len(df)
+        second_rows = np.flatnonzero(df['2nd'].notnull().to_numpy())
+        row_idx = np.concatenate([np.arange(n_rows), second_rows])
+        first_pt = np.concatenate([np.ones(n_rows, dtype=bool), np.zeros(len(second_rows), dtype=bool)])
+        order = np.argsort(2 * row_idx + ~first_pt, kind='stable')
+        row_idx = row_idx[order]
+        first_pt = first_pt[order]
+        point_strs = np.concatenate([df['1st'].to_numpy(dtype=object), df['2nd'].to_numpy(dtype=object)[second_rows]])[order]
+
+        with tmcp_metrics.timer('explode_df.parse'):
+            codes, sub_strs, _, point_of_shot, shot_sequence_nbr, gather = _encode_points(point_strs)
+
+        with tmcp_metrics.timer('explode_df.frame'):
+            codes = codes[gather]
+            columns = {}
+            for col_nbr, (name, enum) in enumerate(_EXPLODE_ENUMS):
+                columns[name] = pd.Categorical.from_codes(codes[:, col_nbr], categories=[member.name for member in enum])
+            columns['is_return'] = codes[:, -1].astype(bool)
+            columns['raw_string'] = np.array(sub_strs, dtype=object)[gather]
+            row_of_shot = row_idx[point_of_shot]
+            columns['match_id'] = df['match_id'].to_numpy()[row_of_shot]
+            columns['pt_nbr'] = df['Pt'].to_numpy()[row_of_shot]
+            columns['first_pt'] = first_pt[point_of_shot]
+            columns['shot_sequence_nbr'] = shot_sequence_nbr
+            shots = pd.DataFrame(columns)
+        tmcp_metrics.count('shots_emitted', len(shots))
+        return shots
+
+    @staticmethod
+    def validate_points(df: 'pd.DataFrame', strict: bool = False) -> 'pd.DataFrame':
+        # one row per anomaly in the 1st/2nd strings of an MCP points frame, located by match_id, pt_nbr, first_pt,
+        # shot_sequence_nbr and character position. This is a separate pass, so parsing never pays for it.
+        # strict raises ValueError on the first anomaly instead.
+        import numpy as np
+        import pandas as pd
+
+        first_strs = df['1st'].to_numpy(dtype=object)
+        second_strs = df['2nd'].to_numpy(dtype=object)
+        second_rows = np.flatnonzero(df['2nd'].notnull().to_numpy())
+        point_strs = np.concatenate([first_strs, second_strs[second_rows]])
+        row_idx = np.concatenate([np.arange(len(df)), second_rows])
+        point_codes, unique_strs = pd.factorize(point_strs, use_na_sentinel=False)
+        unique_anomalies = [_point_anomalies(s) for s in unique_strs]
+
+        match_ids = df['match_id'].to_numpy()
+        pt_nbrs = df['Pt'].to_numpy()
+        rows = []
+        is_bad = np.array([len(anomalies) > 0 for anomalies in unique_anomalies], dtype=bool)
+        bad_points = np.flatnonzero(is_bad[point_codes])
+        for point_nbr in sorted(bad_points.tolist(), key=lambda point_nbr: (row_idx[point_nbr], point_nbr)):
+            row = row_idx[point_nbr]
+            s = point_strs[point_nbr]
+            for shot_sequence_nbr, pos, anomaly in unique_anomalies[point_codes[point_nbr]]:
+                char = s[pos] if isinstance(s, str) and pos < len(s) else None
+                if strict:
+                    raise ValueError(
+                        f'{match_ids[row]} point {pt_nbrs[row]}: {ANOMALIES[anomaly]} {char!r} at {pos} of {s!r}'
+                    )
+                rows.append((match_ids[row], pt_nbrs[row], point_nbr < len(df), shot_sequence_nbr, pos, anomaly, char, s))
+
+        errors = pd.DataFrame(
+            rows,
+            columns=['match_id', 'pt_nbr', 'first_pt', 'shot_sequence_nbr', 'position', 'anomaly', 'char', 'raw_string']
+        )
+        errors['anomaly'] = pd.Categorical.from_codes(errors['anomaly'].to_numpy(dtype=np.int64), categories=ANOMALIES)
+        return errors
+
+    @staticmethod
+    def quarantine_points(df: 'pd.DataFrame') -> Tuple['pd.DataFrame', 'pd.DataFrame']:
+        # splits off every point (row) with an anomaly in either serve string: (clean points, validate_points table)
+        import pandas as pd
+
+        errors = Shot.validate_points(df)
+        if len(errors) == 0:
+            return df, errors
+        bad = pd.MultiIndex.from_frame(df[['match_id', 'Pt']]).isin(
+            pd.MultiIndex.from_frame(errors[['match_id', 'pt_nbr']])
+        )
+        return df[~bad], errors
+
+    @staticmethod
+    def encode_points(strs) -> Dict[str, 'np.ndarray']:
+        # batch parse of a sequence or Series of point strings, None/NaN for a missing string (no 2nd serve) which
+        # has no shots. One array entry per shot: point_idx (position in strs), shot_sequence_nbr, is_return and,
+        # per enum field, the int8 index of the member in definition order or -1 when the shot does not have it.
+        # The shots of strs[i] are entries offsets[i]:offsets[i + 1].
+        import numpy as np
+
+        with tmcp_metrics.timer('encode_points'):
+            codes, _, shot_counts, point_idx, shot_sequence_nbr, gather = _encode_points(np.array(strs, dtype=object))
+            codes = codes[gather]
+            encoded = {
+                'point_idx': point_idx,
+                'shot_sequence_nbr': shot_sequence_nbr,
+                'offsets': np.concatenate([[0], np.cumsum(shot_counts)]),
+            }
+            for col_nbr, (name, _) in enumerate(_ENCODED_ENUMS):
+                encoded[name] = np.ascontiguousarray(codes[:, col_nbr])
+            encoded['is_return'] = codes[:, -1].astype(bool)
+        tmcp_metrics.count('shots_emitted', len(point_idx))
+        return encoded
 
     def to_dict(self):
         return {
@@ -129,51 +497,45 @@ class Shot(object):
 
     @staticmethod
     def parse_shots_string(s: str) -> List['Shot']:
-        segmented_strs = Shot.segment_string(s)
-        shots = []
-        for position, sub_str in enumerate(segmented_strs):
-            shots.append(Shot.parse_shot_string(sub_str, position == 1))
-
+        if tmcp_metrics.active is None:
+            return list(_cached_parse_shots(s))
+        hits = _cached_parse_shots.cache_info().hits
+        shots = list(_cached_parse_shots(s))
+        if _cached_parse_shots.cache_info().hits > hits:
+            tmcp_metrics.active.count('cache_hits')
+        else:
+            tmcp_metrics.active.count('points_parsed')
         return shots
 
     @staticmethod
     def parse_shot_string(s: str, is_return=False) -> 'Shot':
+        return _cached_parse_shot(s, is_return)
+
+    @staticmethod
+    def segment_string(s: str) -> List[str]:
+        return [sub_str for sub_str, _ in _tokenize(s)]
+
+    @staticmethod
+    def configure_cache(maxsize: Optional[int] = _PARSE_CACHE_SIZE) -> None:
+        # maxsize=0 turns caching off, maxsize=None lets the caches grow without bound
+        global _cached_parse_shots, _cached_parse_shot
+        _cached_parse_shots = lru_cache(maxsize=maxsize)(_parse_shots)
+        _cached_parse_shot = lru_cache(maxsize=maxsize)(_parse_shot)
+
+    @staticmethod
+    def cache_info() -> Dict[str, Any]:
+        return {
+            'parse_shots_string': _cached_parse_shots.cache_info(),
+            'parse_shot_string': _cached_parse_shot.cache_info()
+        }
+
+    @staticmethod
+    def _from_codes(s: str, codes: Tuple[int, ...], is_return=False) -> 'Shot':
         assert len(s) > 0
 
-        terminal = None
-        for c in [t.value for t in Terminal]:
-            if str(c) in s:
-                terminal = Terminal(c)
-
-        stroke_type = None
-        for c in [st.value for st in StrokeType]:
-            if str(c) in s:
-                stroke_type = StrokeType(c)
-
-        return_depth = None
-        for c in [rt.value for rt in ReturnDepth]:
-            if str(c) in s:
-                return_depth = ReturnDepth(int(c))
-
-        court_position = None
-        for c in [cp.value for cp in CourtPosition]:
-            if str(c) in s:
-                court_position = CourtPosition(c)
-
-        shot_direction = None
-        for c in [sd.value for sd in ShotDirection]:
-            if str(c) in s:
-                shot_direction = ShotDirection(int(c))
-
-        serve_direction = None
-        for c in [sd.value for sd in ServeDirection]:
-            if str(c) in s:
-                serve_direction = ServeDirection(int(c))
-
-        error = None
-        for c in [e.value for e in ErrorType]:
-            if str(c) in s:
-                error = ErrorType(c)
+        terminal, stroke_type, return_depth, court_position, shot_direction, serve_direction, error = [
+            None if code < 0 else members[code] for members, code in zip(_FIELD_MEMBERS, codes)
+        ]
 
         if is_return or return_depth is not None:
             return Return(
@@ -203,56 +565,173 @@ class Shot(object):
                 raw_string=s
             )
 
-    @staticmethod
-    def segment_string(s: str) -> List[str]:
-        shot_strs = []  # List[str]
-        start_pos = 0
-        curr_shot_str = ''
-        for curr_pos in range(len(s)):
-            c = s[curr_pos]
-            if curr_pos == 0:
-                continue
-            else:
-                if c in set([str(serve_direction.value) for serve_direction in ServeDirection]):
-                    curr_shot_str = c
-                elif c in set([str(terminal.value) for terminal in Terminal]):
-                    curr_shot_str += c
-                elif c in set([str(stroke_type.value) for stroke_type in StrokeType]):
-                    shot_strs.append(s[start_pos: curr_pos])
-                    start_pos = curr_pos
-                    curr_shot_str = c
-                elif c in set([str(sd.value) for sd in ShotDirection]):
-                    curr_shot_str += c
-                elif c in set([str(e.value) for e in ErrorType]):
-                    curr_shot_str += c
-                elif c in set([str(r.value) for r in ReturnDepth]):
-                    curr_shot_str += c
-                elif c in set([str(cp.value) for cp in CourtPosition]):
-                    curr_shot_str += c
-        else:
-            shot_strs.append(s[start_pos:])
-
-        return shot_strs
-
 
 class Serve(Shot):
 
+    __slots__ = ()
+
     def __init__(self,serve_direction: ServeDirection,  court_position: CourtPosition = None, terminal=None, error=None, raw_string=None):
-        super().__init__(court_position, terminal, error, raw_string=raw_string)
-        self.serve_direction = serve_direction
+        self._set_fields(
+            court_position=court_position, terminal=terminal, error_type=error, serve_direction=serve_direction,
+            raw_string=raw_string
+        )
 
 
 class GroundStroke(Shot):
 
+    __slots__ = ()
+
     def __init__(self, stroke_type: StrokeType, shot_direction: ShotDirection = None, court_position: CourtPosition = None, terminal=None, error=None, raw_string=None):
-        super().__init__(court_position, terminal, error, raw_string=raw_string)
-        self.stroke_type = stroke_type
-        self.shot_direction = shot_direction
+        self._set_fields(
+            court_position=court_position, terminal=terminal, error_type=error, stroke_type=stroke_type,
+            shot_direction=shot_direction, raw_string=raw_string
+        )
 
 
 class Return(GroundStroke):
 
+    __slots__ = ()
+
     def __init__(self, return_depth: ReturnDepth = None, stroke_type: StrokeType = None, shot_direction: ShotDirection = None, court_position: CourtPosition = None, terminal=None, error=None, raw_string=None):
-        super().__init__(stroke_type, shot_direction, court_position, terminal, error, raw_string=raw_string)
-        self.return_depth = return_depth
-        self.is_return = True
\ No newline at end of file
+        self._set_fields(
+            court_position=court_position, terminal=terminal, error_type=error, stroke_type=stroke_type,
+            shot_direction=shot_direction, return_depth=return_depth, is_return=True, raw_string=raw_string
+        )
+
+
+# packed layout behind Shot.code: the low bits hold the shot class, then one fixed-width field per enum holding
+# the member index + 1 (0 for None)
+_SHOT_KINDS = (Shot, Serve, GroundStroke, Return)
+_KIND_BITS = 2
+_FIELD_BITS = 5
+_PACKED_FIELDS = (
+    ('court_position', CourtPosition),
+    ('terminal', Terminal),
+    ('error_type', ErrorType),
+    ('serve_direction', ServeDirection),
+    ('stroke_type', StrokeType),
+    ('shot_direction', ShotDirection),
+    ('return_depth', ReturnDepth),
+)
+_PACKED_MEMBERS = {enum: tuple(enum) for _, enum in _PACKED_FIELDS}
+_PACKED_INDEX = {member: index for members in _PACKED_MEMBERS.values() for index, member in enumerate(members)}
+
+
+def _shot_offsets(s: str) -> Tuple[int, ...]:
+    # the start of every shot plus the end of the string, cut where _tokenize cuts
+    return (0, ) + tuple(pos for pos in range(1, len(s)) if s[pos] in _SHOT_STARTS) + (len(s), )
+
+
+class Rally(object):
+    # lazy view over one raw 1st or 2nd serve string: shot boundaries are found on first access and each shot
+    # is decoded (through the parse cache) only when it is read. rally[i] == Shot.parse_shots_string(s)[i]
+
+    __slots__ = ('raw_string', '_offsets')
+
+    def __init__(self, raw_string: str):
+        self.raw_string = raw_string
+        self._offsets = None
+
+    def offsets(self) -> Tuple[int, ...]:
+        if self._offsets is None:
+            self._offsets = _shot_offsets(self.raw_string)
+        return self._offsets
+
+    def __len__(self):
+        return len(self.offsets()) - 1
+
+    def shot_string(self, i: int) -> str:
+        i = range(len(self))[i]
+        return self.raw_string[self._offsets[i]: self._offsets[i + 1]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._shot(j) for j in range(len(self))[i]]
+        return self._shot(range(len(self))[i])
+
+    def _shot(self, i: int) -> Shot:
+        return _cached_parse_shot(self.raw_string[self._offsets[i]: self._offsets[i + 1]], i == 1)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._shot(i)
+
+    def __repr__(self):
+        return f'Rally({self.raw_string!r})'
+
+
+class Point(object):
+    # one charted point: the 1st serve rally and, after a fault, the 2nd serve rally. As a sequence it holds the
+    # shots of both in Shot.explode_df order.
+
+    __slots__ = ('pt_nbr', 'first', 'second')
+
+    def __init__(self, first: str, second: Optional[str] = None, pt_nbr: Optional[int] = None):
+        self.pt_nbr = pt_nbr
+        self.first = Rally(first)
+        self.second = Rally(second) if isinstance(second, str) else None
+
+    def __len__(self):
+        return len(self.first) + (0 if self.second is None else len(self.second))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(self))[i]]
+        i = range(len(self))[i]
+        n_first = len(self.first)
+        return self.first[i] if i < n_first else self.second[i - n_first]
+
+    def __iter__(self):
+        yield from self.first
+        if self.second is not None:
+            yield from self.second
+
+    def __repr__(self):
+        second = None if self.second is None else self.second.raw_string
+        return f'Point({self.first.raw_string!r}, {second!r}, pt_nbr={self.pt_nbr!r})'
+
+
+class Match(object):
+    # lazy sequence of Points over a match's raw 1st/2nd column values (lists, tuples or numpy arrays, a missing
+    # 2nd serve being None or NaN). Points are built on access and slicing keeps the underlying sequences, so
+    # nothing is segmented or decoded until a shot is read.
+
+    __slots__ = ('match_id', 'first_strs', 'second_strs', 'pt_nbrs')
+
+    def __init__(self, match_id: str, first_strs, second_strs, pt_nbrs=None):
+        assert len(first_strs) == len(second_strs)
+        self.match_id = match_id
+        self.first_strs = first_strs
+        self.second_strs = second_strs
+        self.pt_nbrs = pt_nbrs
+
+    def __len__(self):
+        return len(self.first_strs)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Match(
+                self.match_id, self.first_strs[i], self.second_strs[i], None if self.pt_nbrs is None else self.pt_nbrs[i]
+            )
+        i = range(len(self))[i]
+        return Point(self.first_strs[i], self.second_strs[i], None if self.pt_nbrs is None else self.pt_nbrs[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return f'Match({self.match_id!r}, {len(self)} points)'
+
+    @staticmethod
+    def from_df(df: 'pd.DataFrame') -> Dict[str, 'Match']:
+        # match_id -> Match over an MCP points frame in match order; every Match holds views of the frame's columns
+        match_ids = df['match_id'].to_numpy(dtype=object)
+        first_strs = df['1st'].to_numpy(dtype=object)
+        second_strs = df['2nd'].to_numpy(dtype=object)
+        pt_nbrs = df['Pt'].tolist()
+        bounds = df['match_id'].ne(df['match_id'].shift()).to_numpy().nonzero()[0].tolist() + [len(df)]
+        return {
+            match_ids[start]: Match(match_ids[start], first_strs[start: stop], second_strs[start: stop], pt_nbrs[start: stop])
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        }
@@ -0,0 +1,311 @@
+import functools
+import operator
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from tmcp_parser import CourtPosition, ErrorType, Match, ReturnDepth, ServeDirection, Shot, ShotDirection, StrokeType, \
+    Terminal
+
+
+# columns of the per shot code array: the int8 index of the member in definition order, -1 for shots without the
+# field, then is_return as 0/1
+PATTERN_FIELDS = {
+    'serve_direction': ServeDirection,
+    'stroke_type': StrokeType,
+    'shot_direction': ShotDirection,
+    'terminal': Terminal,
+    'error_type': ErrorType,
+    'return_depth': ReturnDepth,
+    'court_position': CourtPosition,
+}
+_IS_RETURN = len(PATTERN_FIELDS)
+
+# n-grams are keyed on these fields only, the others are checked on the candidates the posting lists return
+NGRAM_FIELDS = ('serve_direction', 'stroke_type', 'shot_direction')
+_NGRAM_SHAPE = tuple(len(PATTERN_FIELDS[name]) + 1 for name in NGRAM_FIELDS)
+_NGRAM_RADIX = functools.reduce(operator.mul, _NGRAM_SHAPE)
+
+# a pattern window is only looked up when it expands to at most this many n-gram keys
+MAX_LOOKUP_KEYS = 4096
+
+
+def _shot_tokens(codes: np.ndarray) -> np.ndarray:
+    columns = [list(PATTERN_FIELDS).index(name) for name in NGRAM_FIELDS]
+    return np.ravel_multi_index([codes[:, column].astype(np.int64) + 1 for column in columns], _NGRAM_SHAPE)
+
+
+def _field_mask(name, value) -> np.ndarray:
+    # allowed codes of one field, indexed by code + 1; value is a member name, None for shots without the field
+    # or a list of those
+    members = [member.name for member in PATTERN_FIELDS[name]]
+    mask = np.zeros(len(members) + 1, dtype=bool)
+    for member in value if isinstance(value, (list, tuple, set, frozenset)) else [value]:
+        if member is not None and member not in members:
+            raise ValueError(f'{member!r} is not a {PATTERN_FIELDS[name].__name__}')
+        mask[0 if member is None else members.index(member) + 1] = True
+    return mask
+
+
+def _element_masks(element) -> dict:
+    # field name -> allowed code mask for one pattern element; fields left out or given as '*' match anything
+    masks = {}
+    for name, value in (element or {}).items():
+        if name == 'is_return':
+            if value != '*':
+                masks[name] = np.array([not value, bool(value)])
+        elif name not in PATTERN_FIELDS:
+            raise ValueError(f'unknown pattern field {name!r}')
+        elif value != '*':
+            masks[name] = _field_mask(name, value)
+    return masks
+
+
+def _element_tokens(masks) -> np.ndarray:
+    # every n-gram token a shot matching masks can have
+    axes = [masks[name].nonzero()[0] if name in masks else np.arange(size) for name, size in zip(NGRAM_FIELDS, _NGRAM_SHAPE)]
+    return np.ravel_multi_index(np.meshgrid(*axes, indexing='ij'), _NGRAM_SHAPE).ravel()
+
+
+def _concat_ranges(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    lengths = stops - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+class _Segment(object):
+    # one batch of indexed matches: per point its match, pt_nbr and first_pt, per shot its point,
+    # shot_sequence_nbr and codes, and per n a sorted n-gram key array with offsets into the start shots of each
+    # n-gram. match_alive turns False for the matches a later batch replaced.
+
+    def __init__(self, match_ids, point_match, point_pt, point_first, shot_point, shot_position, codes, max_n):
+        self.match_ids = match_ids
+        self.match_nbrs = {match_id: match_nbr for match_nbr, match_id in enumerate(match_ids)}
+        self.match_alive = np.ones(len(match_ids), dtype=bool)
+        self.point_match = point_match
+        self.point_pt = point_pt
+        self.point_first = point_first
+        self.shot_point = shot_point
+        self.shot_position = shot_position
+        self.codes = codes
+        self.grams = {}
+        tokens = _shot_tokens(codes)
+        for n in range(1, max_n + 1):
+            # n-grams never cross from one point into the next
+            starts = np.arange(max(len(tokens) - n + 1, 0))
+            starts = starts[shot_point[starts + n - 1] == shot_point[starts]]
+            keys = np.zeros(len(starts), dtype=np.int64)
+            for j in range(n):
+                keys = keys * _NGRAM_RADIX + tokens[starts + j]
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            first = np.flatnonzero(np.diff(keys, prepend=-1))
+            self.grams[n] = (keys[first], np.append(first, len(keys)), starts[order].astype(np.int32))
+
+    def __len__(self):
+        return len(self.codes)
+
+    @staticmethod
+    def merge(segments: List['_Segment'], max_n) -> '_Segment':
+        # one segment holding the live matches of segments, in order
+        parts = []
+        n_matches = n_points = 0
+        for segment in segments:
+            keep_match = segment.match_alive
+            match_remap = np.cumsum(keep_match) - 1 + n_matches
+            keep_point = keep_match[segment.point_match]
+            point_remap = np.cumsum(keep_point) - 1 + n_points
+            keep_shot = keep_point[segment.shot_point]
+            parts.append((
+                segment.match_ids[keep_match],
+                match_remap[segment.point_match[keep_point]].astype(np.int32),
+                segment.point_pt[keep_point],
+                segment.point_first[keep_point],
+                point_remap[segment.shot_point[keep_shot]].astype(np.int32),
+                segment.shot_position[keep_shot],
+                segment.codes[keep_shot],
+            ))
+            n_matches += int(keep_match.sum())
+            n_points += int(keep_point.sum())
+        return _Segment(*[np.concatenate(arrays) for arrays in zip(*parts)], max_n=max_n)
+
+    def _window(self, element_tokens, max_n):
+        # (n, offset, key positions) of the pattern window with the shortest posting lists, None when no window
+        # narrows the search down (every element is a wildcard on NGRAM_FIELDS or expands to too many keys)
+        best = None
+        for n in range(1, min(max_n, len(element_tokens)) + 1):
+            gram_keys, offsets, _ = self.grams[n]
+            for offset in range(len(element_tokens) - n + 1):
+                window = element_tokens[offset: offset + n]
+                if all(tokens is None for tokens in window):
+                    continue
+                window = [np.arange(_NGRAM_RADIX) if tokens is None else tokens for tokens in window]
+                if functools.reduce(operator.mul, map(len, window)) > MAX_LOOKUP_KEYS:
+                    continue
+                keys = functools.reduce(lambda keys, tokens: (keys[:, None] * _NGRAM_RADIX + tokens).ravel(), window)
+                idx = np.searchsorted(gram_keys, keys)
+                found = idx < len(gram_keys)
+                idx = idx[found][gram_keys[idx[found]] == keys[found]]
+                size = int((offsets[idx + 1] - offsets[idx]).sum())
+                if best is None or size < best[0]:
+                    best = (size, n, offset, idx)
+        return None if best is None else best[1:]
+
+    def find(self, element_masks, element_tokens, max_n, start=None, last=False) -> np.ndarray:
+        # the start shots of every occurrence in the live matches
+        shot_point, codes = self.shot_point, self.codes
+        window = self._window(element_tokens, max_n)
+        if window is None:
+            candidates = np.arange(len(shot_point))
+        else:
+            n, offset, idx = window
+            _, offsets, postings = self.grams[n]
+            candidates = np.sort(postings[_concat_ranges(offsets[idx], offsets[idx + 1])]).astype(np.int64) - offset
+            candidates = candidates[candidates >= 0]
+        if not self.match_alive.all():
+            candidates = candidates[self.match_alive[self.point_match[shot_point[candidates]]]]
+
+        if start is not None:
+            candidates = candidates[self.shot_position[candidates] == start]
+        for j, masks in enumerate(element_masks):
+            shots = candidates + j
+            candidates = candidates[shots < len(shot_point)]
+            shots = candidates + j
+            keep = shot_point[shots] == shot_point[candidates]
+            for name, mask in masks.items():
+                column = _IS_RETURN if name == 'is_return' else list(PATTERN_FIELDS).index(name)
+                keep &= mask[codes[shots, column].astype(np.int64) + (0 if name == 'is_return' else 1)]
+            candidates = candidates[keep]
+        if last:
+            after = candidates + len(element_masks)
+            candidates = candidates[
+                (after >= len(shot_point)) | (shot_point[np.minimum(after, len(shot_point) - 1)] != shot_point[candidates])
+            ]
+        return candidates
+
+
+class ShotPatternIndex(object):
+    # posting lists of shot n-grams (n = 1..max_n, keyed on NGRAM_FIELDS) over every 1st and 2nd serve point of
+    # the matches added, all array backed. Every add builds the postings of its own matches only, as a new segment;
+    # an added match replaces the indexed one, whose old copy is only marked dead. Segments are merged like a
+    # binary counter (a segment merges into the one before it once as large), so every shot is rebuilt a
+    # logarithmic number of times and a query looks at a logarithmic number of segments. compact() and save()
+    # merge everything into one segment.
+
+    def __init__(self, max_n=3):
+        self.max_n = max_n
+        self._segments = []
+        self._owner = {}
+
+    def __len__(self):
+        return len(self._owner)
+
+    def add(self, match: Match) -> None:
+        pt_nbrs = range(1, len(match) + 1) if match.pt_nbrs is None else match.pt_nbrs
+        self._add_segment(np.full(len(match), match.match_id, dtype=object), pt_nbrs, match.first_strs, match.second_strs)
+
+    def add_points(self, df: pd.DataFrame) -> None:
+        # every match of an MCP points frame (match_id, Pt, 1st, 2nd columns) in one batch parse
+        self._add_segment(
+            df['match_id'].to_numpy(dtype=object), df['Pt'].to_numpy(), df['1st'].to_numpy(dtype=object),
+            df['2nd'].to_numpy(dtype=object)
+        )
+
+    def _add_segment(self, match_ids, pt_nbrs, first_strs, second_strs):
+        # 1st and 2nd serve of a point are consecutive index points
+        n_points = len(match_ids)
+        strs = np.empty(2 * n_points, dtype=object)
+        strs[0::2] = first_strs
+        strs[1::2] = second_strs
+        encoded = Shot.encode_points(strs)
+        match_codes, segment_match_ids = pd.factorize(np.asarray(match_ids, dtype=object))
+
+        codes = np.empty((len(encoded['point_idx']), len(PATTERN_FIELDS) + 1), dtype=np.int8)
+        for column, name in enumerate(PATTERN_FIELDS):
+            codes[:, column] = encoded[name]
+        codes[:, _IS_RETURN] = encoded['is_return']
+
+        self._append(_Segment(
+            np.asarray(segment_match_ids, dtype=object),
+            np.repeat(match_codes, 2).astype(np.int32),
+            np.repeat(np.asarray(pt_nbrs, dtype=np.int32), 2),
+            np.tile([True, False], n_points),
+            encoded['point_idx'].astype(np.int32),
+            encoded['shot_sequence_nbr'].astype(np.int16),
+            codes,
+            max_n=self.max_n,
+        ))
+        while len(self._segments) > 1 and len(self._segments[-2]) <= len(self._segments[-1]):
+            self._merge(len(self._segments) - 2)
+
+    def _append(self, segment):
+        for match_id in segment.match_ids:
+            replaced = self._owner.get(match_id)
+            if replaced is not None:
+                replaced.match_alive[replaced.match_nbrs[match_id]] = False
+            self._owner[match_id] = segment
+        self._segments.append(segment)
+
+    def _merge(self, first):
+        # merges the segments from position first on into one
+        merged = _Segment.merge(self._segments[first:], self.max_n)
+        self._segments[first:] = [merged]
+        self._owner.update(dict.fromkeys(merged.match_ids, merged))
+
+    def compact(self) -> None:
+        if len(self._segments) > 1 or (self._segments and not self._segments[0].match_alive.all()):
+            self._merge(0)
+
+    def find(self, pattern, start=None, last=False) -> pd.DataFrame:
+        # every occurrence of pattern, a list with one element per consecutive shot: a dict of PATTERN_FIELDS (and
+        # is_return) to a member name, None for shots without the field, a list of those or '*', and None or {}
+        # for any shot. start restricts the first element to that shot_sequence_nbr (0 for the serve); with last
+        # the final element must be the point's last shot. E.g. a wide serve, any return, then a forehand winner:
+        # find([{'serve_direction': 'wide'}, None, {'stroke_type': 'forehand', 'terminal': 'winner'}], start=0)
+        element_masks = [_element_masks(element) for element in pattern]
+        element_tokens = [
+            _element_tokens(masks) if any(name in masks for name in NGRAM_FIELDS) else None for masks in element_masks
+        ]
+        # match_id is categorical over the live match ids, numbered segment by segment
+        categories = []
+        frames = []
+        n_matches = 0
+        for segment in self._segments:
+            match_remap = np.cumsum(segment.match_alive) - 1 + n_matches
+            categories.append(segment.match_ids[segment.match_alive])
+            n_matches += len(categories[-1])
+            if not element_masks:
+                continue
+            shots = segment.find(element_masks, element_tokens, self.max_n, start=start, last=last)
+            points = segment.shot_point[shots]
+            frames.append((
+                match_remap[segment.point_match[points]], segment.point_pt[points], segment.point_first[points],
+                segment.shot_position[shots]
+            ))
+        match_codes, pt_nbrs, first_pts, positions = (
+            [np.concatenate(arrays) for arrays in zip(*frames)] if frames
+            else (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int16))
+        )
+        return pd.DataFrame({
+            'match_id': pd.Categorical.from_codes(
+                match_codes, categories=np.concatenate(categories) if categories else np.zeros(0, dtype=object)
+            ),
+            'pt_nbr': pt_nbrs,
+            'first_pt': first_pts,
+            'shot_sequence_nbr': positions,
+        })
+
+    def count(self, pattern, start=None, last=False) -> int:
+        return len(self.find(pattern, start=start, last=last))
+
+    def save(self, path) -> None:
+        self.compact()
+        pd.to_pickle((self.max_n, self._segments), path)
+
+    @staticmethod
+    def load(path) -> 'ShotPatternIndex':
+        max_n, segments = pd.read_pickle(path)
+        index = ShotPatternIndex(max_n)
+        for segment in segments:
+            index._append(segment)
+        return index
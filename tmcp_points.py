@@ -0,0 +1,124 @@
+from typing import Dict, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from tmcp_parser import Shot, Terminal
+
+
+POINT_OUTCOMES = ['ace', 'unreturned', 'winner', 'error', 'forced_error', 'double_fault', 'penalty']
+
+# MCP codes for points awarded without a rally: S/R point to server/returner, P/Q penalty against server/returner
+_PENALTY_CODES = {'S': 1, 'Q': 1, 'R': 0, 'P': 0}
+
+
+def _serve_outcome(s: str) -> Tuple[bool, int, int, int]:
+    # (is a fault, rally length, 1 if the server won / 0 if the returner won / -1 if unknown, POINT_OUTCOMES index)
+    if s in _PENALTY_CODES:
+        return False, 0, _PENALTY_CODES[s], POINT_OUTCOMES.index('penalty')
+    shots = Shot.parse_shots_string(s)
+    last = shots[-1]
+    if last.terminal is None:
+        if len(shots) == 1 and last.error_type is not None:
+            return True, 1, 0, POINT_OUTCOMES.index('double_fault')
+        return False, len(shots), -1, -1
+    # the server hits the even shots; a terminal serve (ace or unreturned serve) always goes to the server
+    hitter_is_server = len(shots) % 2 == 1
+    if len(shots) == 1:
+        outcome = 'ace' if last.terminal == Terminal.winner else 'unreturned'
+        return False, 1, 1, POINT_OUTCOMES.index(outcome)
+    if last.terminal == Terminal.winner:
+        return False, len(shots), int(hitter_is_server), POINT_OUTCOMES.index('winner')
+    outcome = 'error' if last.terminal == Terminal.error else 'forced_error'
+    return False, len(shots), int(not hitter_is_server), POINT_OUTCOMES.index(outcome)
+
+
+def _serve_outcomes(strs: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # one _serve_outcome call per distinct string, gathered back with numpy
+    codes, uniques = pd.factorize(strs)
+    outcomes = np.array(
+        [_serve_outcome(s) for s in uniques] + [(False, 0, -1, -1)], dtype=np.int64
+    ).reshape(-1, 4)[codes]
+    return outcomes[:, 0].astype(bool), outcomes[:, 1], outcomes[:, 2], outcomes[:, 3]
+
+
+def point_states(df: pd.DataFrame, best_of: Union[int, Dict[str, int]] = 3, final_set_tiebreak=7) -> pd.DataFrame:
+    # one row per point of an MCP points frame (match_id, Pt, Svr, 1st, 2nd; PtWinner is used when a point
+    # string has no terminal shot) with the server, serve number, rally length, outcome, winner and the
+    # set/game/point score before the point. Points must be in match order. best_of is an int or a
+    # match_id -> best of mapping; final_set_tiebreak is the final set tiebreak length, None for advantage sets.
+    first_fault, first_len, first_server_won, first_outcome = _serve_outcomes(df['1st'].to_numpy(dtype=object))
+    second_fault, second_len, second_server_won, second_outcome = _serve_outcomes(df['2nd'].to_numpy(dtype=object))
+    has_second = df['2nd'].notnull().to_numpy()
+
+    # MCP only fills 2nd after a 1st serve fault, also one coded with e, ! or V, which the parser does not know
+    on_second = has_second
+    serve_nbr = np.where(on_second, 2, 1)
+    rally_length = np.where(on_second, second_len, first_len)
+    server_won = np.where(on_second, second_server_won, np.where(first_fault, -1, first_server_won))
+    outcome = np.where(on_second, second_outcome, np.where(first_fault, -1, first_outcome))
+
+    server = df['Svr'].to_numpy(dtype=np.int64)
+    point_winner = np.where(server_won == 1, server, np.where(server_won == 0, 3 - server, 0))
+    if 'PtWinner' in df.columns:
+        point_winner = np.where(point_winner == 0, df['PtWinner'].fillna(0).to_numpy(dtype=np.int64), point_winner)
+
+    match_ids = df['match_id'].to_numpy()
+    scores = np.zeros((len(df), 6), dtype=np.int64)
+    tiebreak = np.zeros(len(df), dtype=bool)
+    match_starts = np.flatnonzero(df['match_id'].ne(df['match_id'].shift()).to_numpy()).tolist() + [len(df)]
+    for start, stop in zip(match_starts[:-1], match_starts[1:]):
+        match_best_of = best_of if isinstance(best_of, int) else best_of.get(match_ids[start], 3)
+        _score_match(point_winner[start: stop], match_best_of, final_set_tiebreak, scores[start: stop], tiebreak[start: stop])
+
+    return pd.DataFrame({
+        'match_id': match_ids,
+        'pt_nbr': df['Pt'].to_numpy(),
+        'server': server,
+        'serve_nbr': serve_nbr,
+        'rally_length': rally_length,
+        'point_outcome': pd.Categorical.from_codes(outcome, categories=POINT_OUTCOMES),
+        'point_winner': point_winner,
+        'set1': scores[:, 0],
+        'set2': scores[:, 1],
+        'gm1': scores[:, 2],
+        'gm2': scores[:, 3],
+        'pts1': scores[:, 4],
+        'pts2': scores[:, 5],
+        'tiebreak': tiebreak,
+    })
+
+
+def _score_match(point_winner: np.ndarray, best_of: int, final_set_tiebreak, scores: np.ndarray, tiebreak: np.ndarray):
+    # fills scores (set1, set2, gm1, gm2, pts1, pts2) and tiebreak with the state before every point
+    sets = [0, 0]
+    games = [0, 0]
+    pts = [0, 0]
+    in_tiebreak = False
+    tiebreak_target = 7
+    for pt_nbr, winner in enumerate(point_winner.tolist()):
+        scores[pt_nbr] = sets + games + pts
+        tiebreak[pt_nbr] = in_tiebreak
+        if winner not in (1, 2):
+            continue
+        won, lost = winner - 1, 2 - winner
+        pts[won] += 1
+        if pts[won] < (tiebreak_target if in_tiebreak else 4) or pts[won] - pts[lost] < 2:
+            continue
+        pts = [0, 0]
+        games[won] += 1
+        final_set = sets[0] + sets[1] == best_of - 1
+        if in_tiebreak or (games[won] >= 6 and games[won] - games[lost] >= 2):
+            sets[won] += 1
+            games = [0, 0]
+            in_tiebreak = False
+        elif games == [6, 6] and not (final_set and final_set_tiebreak is None):
+            in_tiebreak = True
+            tiebreak_target = final_set_tiebreak if final_set else 7
+
+
+def annotate_shots(shots: pd.DataFrame, states: pd.DataFrame) -> pd.DataFrame:
+    # joins point_states onto Shot.explode_df output and adds the player (1 or 2) who hit each shot
+    shots = shots.merge(states, on=['match_id', 'pt_nbr'], how='left')
+    shots['hitter'] = np.where(shots['shot_sequence_nbr'] % 2 == 0, shots['server'], 3 - shots['server'])
+    return shots
@@ -0,0 +1,59 @@
+import pathlib
+
+
+# Declared layouts of the MCP charting CSVs: only the columns the parser and loaders use are read, each with a
+# fixed dtype, so nothing is inferred over the whole file and code reads columns by name, never by position.
+
+POINTS_DTYPES = {
+    'match_id': 'str',
+    'Pt': 'int32',
+    'Svr': 'Int8',
+    '1st': 'str',
+    '2nd': 'str',
+    'PtWinner': 'Int8',
+}
+
+MATCHES_DTYPES = {
+    'match_id': 'str',
+    'Player 1': 'str',
+    'Player 2': 'str',
+    'Date': 'str',
+    'Tournament': 'category',
+    'Round': 'category',
+    'Surface': 'category',
+    'Best of': 'Int8',
+}
+
+
+def read_csv_kwargs(dtypes, **overrides):
+    # read_csv arguments for a schema; a declared column missing from a file is skipped, not an error
+    columns = frozenset(dtypes)
+    return dict(dict(usecols=columns.__contains__, dtype=dtypes), **overrides)
+
+
+def points_csv_kwargs(**overrides):
+    return read_csv_kwargs(POINTS_DTYPES, **overrides)
+
+
+def matches_csv_kwargs(**overrides):
+    return read_csv_kwargs(MATCHES_DTYPES, **overrides)
+
+
+# charting file tags: m for the men's tour, f for the women's
+TOURS = ('m', 'f')
+
+
+def tour_tag(male=True):
+    return 'm' if male else 'f'
+
+
+def charting_files(data_path):
+    # tour tag -> {'matches': path or None, 'points': [paths]} for every tour with charting files in data_path
+    data_path = pathlib.Path(data_path)
+    files = {}
+    for tour in TOURS:
+        matches_path = data_path / f'charting-{tour}-matches.csv'
+        points_paths = sorted(data_path.glob(f'charting-{tour}-points*.csv'))
+        if matches_path.exists() or points_paths:
+            files[tour] = {'matches': matches_path if matches_path.exists() else None, 'points': points_paths}
+    return files
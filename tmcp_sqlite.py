@@ -0,0 +1,111 @@
+import re
+import sqlite3
+
+from insert_db import DBLoader
+
+
+# in-process SQLite stand-in for the MySQL database DBLoader loads, used by the tests and benchmarks; shot_f and
+# load_checkpoint come from the loader's own CREATE TABLE IF NOT EXISTS statements
+
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tournament_d (id INTEGER PRIMARY KEY, name TEXT UNIQUE COLLATE NOCASE);
+    CREATE TABLE IF NOT EXISTS player_d (id INTEGER PRIMARY KEY, name TEXT UNIQUE COLLATE NOCASE, male INTEGER);
+    CREATE TABLE IF NOT EXISTS match_f (
+        id INTEGER PRIMARY KEY, player1_id INTEGER, player2_id INTEGER, tournament_id INTEGER, round TEXT,
+        surface TEXT, best_of_sets INTEGER, mcp_id TEXT UNIQUE, match_date TEXT
+    );
+"""
+
+
+class SQLiteCursor(object):
+
+    def __init__(self, connection, dictionary=False):
+        self.connection = connection
+        self.cursor = connection.conn.cursor()
+        self.dictionary = dictionary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.cursor.close()
+
+    @staticmethod
+    def _sql(sql):
+        sql = re.sub(r'CREATE TEMPORARY TABLE (\w+) LIKE (\w+)', r'CREATE TEMP TABLE \1 AS SELECT * FROM \2 WHERE 0', sql)
+        return sql.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE').replace('DROP TEMPORARY', 'DROP')
+
+    def execute(self, sql, params=()):
+        self.connection.round_trips += 1
+        load = re.match(r'\s*LOAD DATA LOCAL INFILE %s\s+(IGNORE )?INTO TABLE (\w+).*\((.*)\)\s*$', sql, re.S)
+        if load is not None:
+            return self._load_data(params[0], load.group(2), [column.strip() for column in load.group(3).split(',')],
+                                   ignore=load.group(1) is not None)
+        self.cursor.execute(self._sql(sql), params)
+
+    def _load_data(self, path, table, columns, ignore):
+        # LOAD DATA's default format, converted the way MySQL converts it outside strict mode: a value an
+        # integer column cannot parse loads as 0. Every file loaded is kept in connection.loaded_files.
+        with open(path, encoding='utf-8', newline='') as f:
+            text = f.read()
+        self.connection.loaded_files.append((table, text))
+        types = {row[1]: row[2] for row in self.cursor.execute(f'PRAGMA table_info({table})').fetchall()}
+        escapes = {'t': '\t', 'n': '\n', '\\': '\\'}
+        rows = []
+        for line in text.split('\n')[:-1]:
+            row = []
+            for column, value in zip(columns, line.split('\t')):
+                if value == '\\N':
+                    row.append(None)
+                    continue
+                value = re.sub(r'\\(.)', lambda m: escapes.get(m.group(1), m.group(1)), value)
+                # SQLite's rule for integer affinity, which covers INT, TINYINT(1) and SMALLINT
+                if 'INT' in types[column].upper():
+                    value = int(value) if re.fullmatch(r'-?\d+', value) else 0
+                row.append(value)
+            rows.append(row)
+        self.cursor.executemany(
+            f"INSERT {'OR IGNORE ' if ignore else ''}INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['?'] * len(columns))})",
+            rows
+        )
+
+    def executemany(self, sql, rows):
+        # mysql.connector sends a batched INSERT as one multi-row statement
+        self.connection.round_trips += 1
+        self.cursor.executemany(self._sql(sql), rows)
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        if self.dictionary:
+            names = [column[0] for column in self.cursor.description]
+            return [dict(zip(names, row)) for row in rows]
+        return rows
+
+
+class SQLiteConnection(object):
+    # in-process stand-in for the mysql.connector connection DBLoader talks to
+
+    def __init__(self, database=':memory:'):
+        self.conn = sqlite3.connect(database)
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.commits = 0
+        self.round_trips = 0
+        self.loaded_files = []
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self, dictionary)
+
+    def commit(self):
+        self.commits += 1
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class SQLiteDBLoader(DBLoader):
+
+    def _connect(self):
+        return SQLiteConnection(self.database_name)
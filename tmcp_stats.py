@@ -0,0 +1,122 @@
+import functools
+import operator
+
+import numpy as np
+import pandas as pd
+
+from tmcp_parser import CourtPosition, ErrorType, ReturnDepth, ServeDirection, StrokeType, Terminal
+
+
+STATS_FIELDS = {
+    'stroke_type': StrokeType,
+    'terminal': Terminal,
+    'error_type': ErrorType,
+    'serve_direction': ServeDirection,
+    'return_depth': ReturnDepth,
+    'court_position': CourtPosition,
+}
+
+# every block is a dense counter over the listed fields, the last slot of each field counting shots without it
+STATS_BLOCKS = tuple((name, ) for name in STATS_FIELDS) + (('stroke_type', 'terminal'), ('terminal', 'error_type'))
+
+
+def _block_shape(block):
+    return tuple(len(STATS_FIELDS[name]) + 1 for name in block)
+
+
+def _block_offsets():
+    offsets = {}
+    offset = 0
+    for block in STATS_BLOCKS:
+        offsets[block] = offset
+        offset += functools.reduce(operator.mul, _block_shape(block))
+    return offsets, offset
+
+
+_BLOCK_OFFSETS, _N_FEATURES = _block_offsets()
+
+
+def match_players(match_id: str):
+    # MCP match ids end with the two player names, e.g. 20190101-M-Brisbane-R32-Player_One-Player_Two
+    player1, player2 = match_id.split('-')[-2:]
+    return player1.replace('_', ' '), player2.replace('_', ' ')
+
+
+class MatchStatsIndex(object):
+    # one row of counters per (match, player): rows holds match_id, player_nbr, player and any match metadata,
+    # counts holds the matching int32 counter vectors laid out by STATS_BLOCKS
+
+    def __init__(self):
+        self.rows = pd.DataFrame({'match_id': pd.Series(dtype=object), 'player_nbr': pd.Series(dtype=np.int64)})
+        self.counts = np.zeros((0, _N_FEATURES), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, shots: pd.DataFrame, matches: pd.DataFrame = None) -> None:
+        # shots is tmcp_points.annotate_shots output for one or more matches; matches already in the index are
+        # replaced. matches is an optional charting matches frame whose columns are kept as metadata.
+        keys = pd.MultiIndex.from_arrays([shots['match_id'], shots['hitter']])
+        row_codes, row_keys = pd.factorize(keys)
+        n_rows = len(row_keys)
+
+        counts = np.zeros((n_rows, _N_FEATURES), dtype=np.int32)
+        codes = {
+            name: pd.Categorical(shots[name], categories=[member.name for member in enum]).codes.astype(np.int64)
+            for name, enum in STATS_FIELDS.items()
+        }
+        for name, enum in STATS_FIELDS.items():
+            codes[name][codes[name] < 0] = len(enum)
+        for block, offset in _BLOCK_OFFSETS.items():
+            shape = _block_shape(block)
+            features = np.ravel_multi_index([codes[name] for name in block], shape)
+            size = functools.reduce(operator.mul, shape)
+            counts[:, offset: offset + size] = np.bincount(
+                row_codes * size + features, minlength=n_rows * size
+            ).reshape(n_rows, size)
+
+        rows = pd.DataFrame({
+            'match_id': row_keys.get_level_values(0).to_numpy(dtype=object),
+            'player_nbr': row_keys.get_level_values(1).to_numpy(dtype=np.int64),
+        })
+        if matches is not None:
+            matches = matches.drop_duplicates('match_id').set_index('match_id')
+            players = matches[['Player 1', 'Player 2']].reindex(rows['match_id']).to_numpy()
+            rows['player'] = np.where(rows['player_nbr'] == 1, players[:, 0], players[:, 1])
+            metadata = matches.drop(columns=['Player 1', 'Player 2']).reindex(rows['match_id']).reset_index(drop=True)
+            rows = pd.concat([rows, metadata], axis=1)
+        else:
+            rows['player'] = [match_players(m)[p - 1] for m, p in zip(rows['match_id'], rows['player_nbr'])]
+
+        keep = ~self.rows['match_id'].isin(rows['match_id']).to_numpy()
+        self.rows = pd.concat([self.rows[keep], rows], ignore_index=True)
+        self.counts = np.concatenate([self.counts[keep], counts])
+
+    def counts_by(self, by=('player', ), **filters) -> pd.Series:
+        # e.g. counts_by(['player', 'Surface'], stroke_type='forehand', terminal='winner'); filters are field
+        # name -> member name (None for shots without the field) and must fit into one of STATS_BLOCKS
+        blocks = [block for block in STATS_BLOCKS if set(filters) <= set(block)]
+        if not blocks:
+            raise ValueError(f'no counter block covers {sorted(filters)}')
+        block = min(blocks, key=len)
+        shape = _block_shape(block)
+        mask = np.ones(shape, dtype=bool)
+        for axis, name in enumerate(block):
+            if name in filters:
+                members = [member.name for member in STATS_FIELDS[name]]
+                index = len(members) if filters[name] is None else members.index(filters[name])
+                axis_mask = np.zeros(shape[axis], dtype=bool)
+                axis_mask[index] = True
+                mask &= np.expand_dims(axis_mask, [other for other in range(len(shape)) if other != axis])
+        offset = _BLOCK_OFFSETS[block]
+        values = self.counts[:, offset: offset + mask.size] @ mask.ravel().astype(np.int64)
+        return pd.Series(values, index=self.rows.index).groupby([self.rows[column] for column in by]).sum()
+
+    def save(self, path) -> None:
+        pd.to_pickle((self.rows, self.counts), path)
+
+    @staticmethod
+    def load(path) -> 'MatchStatsIndex':
+        index = MatchStatsIndex()
+        index.rows, index.counts = pd.read_pickle(path)
+        return index